@@ -0,0 +1,117 @@
+import numpy as np
+import unittest
+from typing import List, Sequence, Tuple
+
+from experiment.resultStore import CATEGORIES, RECORD, ResultSet
+
+# the ratios reported for every cell, each over the per-trial optimum
+VALUES = ('socialWelfare', 'revenue')
+
+class Aggregator:
+    # Running statistics of every (graph, distribution, mechanism) cell, fed
+    # records as they are produced. For each value y (SW, revenue) and the
+    # optimum x it keeps n and the sums of x, y, x^2, y^2 and xy, which give
+    # the ratio estimate R = sum(y) / sum(x) of the normalized SW or revenue
+    # and, by the delta method, its variance
+    #   Var(R) ~ sum((y - R x)^2) / ((n - 1) n mean(x)^2)
+    # for a normal confidence interval of half-width z * sqrt(Var(R)).
+    def __init__(self, graphs: Sequence[str], distributions: Sequence[str], mechanisms: Sequence[str],
+            z: float = 1.96):
+        self.names = {'graph': list(graphs), 'distribution': list(distributions), 'mechanism': list(mechanisms)}
+        self.shape = (len(self.names['graph']), len(self.names['distribution']), len(self.names['mechanism']))
+        self.z = z
+        self.count = np.zeros(self.shape, dtype=np.int64)
+        self.sx = np.zeros(self.shape)
+        self.sxx = np.zeros(self.shape)
+        self.sy = {name: np.zeros(self.shape) for name in VALUES}
+        self.syy = {name: np.zeros(self.shape) for name in VALUES}
+        self.sxy = {name: np.zeros(self.shape) for name in VALUES}
+
+    def add(self, records: np.ndarray):
+        # records coded by the names of this aggregator; others (code -1) are ignored
+        keep = (records['graph'] >= 0) & (records['distribution'] >= 0) & (records['mechanism'] >= 0)
+        cell = np.ravel_multi_index((records['graph'][keep], records['distribution'][keep],
+            records['mechanism'][keep]), self.shape)
+        size = self.count.size
+        x = records['optimal'][keep]
+        self.count += np.bincount(cell, minlength=size).reshape(self.shape)
+        self.sx += np.bincount(cell, weights=x, minlength=size).reshape(self.shape)
+        self.sxx += np.bincount(cell, weights=x * x, minlength=size).reshape(self.shape)
+        for name in VALUES:
+            y = records[name][keep]
+            self.sy[name] += np.bincount(cell, weights=y, minlength=size).reshape(self.shape)
+            self.syy[name] += np.bincount(cell, weights=y * y, minlength=size).reshape(self.shape)
+            self.sxy[name] += np.bincount(cell, weights=x * y, minlength=size).reshape(self.shape)
+
+    def addResults(self, results: ResultSet):
+        results.checkUnique()
+        columns = CATEGORIES + ('optimal',) + VALUES
+        for chunk in results.recoded(columns, self.names):
+            records = np.zeros(len(chunk['optimal']), dtype=RECORD)
+            for name in columns:
+                records[name] = chunk[name]
+            self.add(records)
+
+    def ratio(self, name: str) -> Tuple[np.ndarray, np.ndarray]:
+        # the estimate and confidence half-width of every cell; nan and inf
+        # while a cell has too few trials
+        n = self.count
+        with np.errstate(divide='ignore', invalid='ignore'):
+            R = self.sy[name] / self.sx
+            residual = np.maximum(self.syy[name] - 2 * R * self.sxy[name] + R * R * self.sxx, 0)
+            variance = residual * n / ((n - 1) * self.sx * self.sx)
+            halfWidth = np.where(n >= 2, self.z * np.sqrt(variance), np.inf)
+        return R, halfWidth
+
+    def converged(self, width: float) -> np.ndarray:
+        # cells whose intervals of every value are at most width wide
+        return np.all([2 * self.ratio(name)[1] <= width for name in VALUES], axis=0)
+
+    def trialsNeeded(self, width: float) -> np.ndarray:
+        # projected trials for every value's interval to reach width, from
+        # the half-width shrinking as 1 / sqrt(n)
+        needed = np.zeros(self.shape)
+        for name in VALUES:
+            _, halfWidth = self.ratio(name)
+            with np.errstate(invalid='ignore'):
+                needed = np.maximum(needed, self.count * (2 * halfWidth / width) ** 2)
+        return needed
+
+    def summary(self) -> List[str]:
+        R = {name: self.ratio(name) for name in VALUES}
+        lines = []
+        for index in np.ndindex(*self.shape):
+            if self.count[index] == 0:
+                continue
+            gname, dname, mname = (self.names[category][k] for category, k in zip(CATEGORIES, index))
+            sw, swWidth = R['socialWelfare'][0][index], R['socialWelfare'][1][index]
+            rev, revWidth = R['revenue'][0][index], R['revenue'][1][index]
+            lines.append(f'{gname} {dname} {mname}, Normlized SW {sw:.4f} +- {swWidth:.4f}, '
+                f'normalized revenue {rev:.4f} +- {revWidth:.4f}, trials {self.count[index]}')
+        return lines
+
+class TestAggregator(unittest.TestCase):
+    def test_ratio(self):
+        rng = np.random.default_rng(0)
+        records = np.zeros(400, dtype=RECORD)
+        records['mechanism'] = np.arange(400) % 2
+        records['optimal'] = rng.uniform(1, 2, 400)
+        records['socialWelfare'] = records['optimal'] * rng.uniform(0.5, 1, 400)
+        records['revenue'] = records['optimal'] * 0.5
+        aggregator = Aggregator(['G'], ['u'], ['A', 'B'])
+        aggregator.add(records[:150])
+        aggregator.add(records[150:])
+        x, y = records['optimal'][1::2], records['socialWelfare'][1::2]
+        R, halfWidth = aggregator.ratio('socialWelfare')
+        self.assertAlmostEqual(R[0, 0, 1], y.sum() / x.sum())
+        # the delta-method standard error of a ratio of means
+        se = np.sqrt(np.var(y - R[0, 0, 1] * x, ddof=1) / len(x)) / x.mean()
+        self.assertAlmostEqual(halfWidth[0, 0, 1], 1.96 * se)
+        # revenue is exactly half the optimum, so its interval has width 0
+        self.assertEqual(aggregator.converged(1e-9).tolist(), [[[False, False]]])
+        self.assertAlmostEqual(aggregator.ratio('revenue')[1].max(), 0)
+        # halving the width takes four times the trials
+        self.assertAlmostEqual(aggregator.trialsNeeded(halfWidth[0, 0, 1])[0, 0, 1], 4 * 200)
+
+if __name__ == "__main__":
+    unittest.main()
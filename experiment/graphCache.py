@@ -0,0 +1,186 @@
+import hashlib
+import inspect
+import json
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+from typing import Any, Dict, List, Optional, Sequence
+from mechanism.auctionGraph import AuctionGraph
+
+def describe(obj: Any) -> str:
+    # a stable description of a graph generator or bid distribution for cache
+    # keys: its class and constructor parameters. A frozen scipy distribution
+    # is described by its name and arguments.
+    if hasattr(obj, 'dist') and hasattr(obj, 'args'):
+        return f'scipy.stats.{obj.dist.name}{obj.args}{sorted(obj.kwds.items())}'
+    params = []
+    for name in inspect.signature(type(obj).__init__).parameters:
+        if name == 'self' or not hasattr(obj, name):
+            continue
+        value = getattr(obj, name)
+        if not (value is None or isinstance(value, (bool, int, float, str))):
+            value = type(value).__name__
+        params.append((name, value))
+    return f'{type(obj).__module__}.{type(obj).__qualname__}{params}'
+
+class GraphCorpus(Sequence):
+    # The graphs and sellers of a block of trials packed into flat arrays:
+    # graph k has nodes nodePtr[k]:nodePtr[k + 1] of the concatenated out- and
+    # in-CSR arrays, edges edgePtr[k]:edgePtr[k + 1] and, if it is labelled,
+    # labels labelPtr[k]:labelPtr[k + 1]. Graphs are built on first access as
+    # views of the (possibly memory-mapped) arrays.
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.arrays = arrays
+        self.graphs: List[Optional[AuctionGraph]] = [None] * (len(arrays['nodePtr']) - 1)
+
+    @staticmethod
+    def pack(graphs: List[AuctionGraph], sellers: List[int]) -> Dict[str, np.ndarray]:
+        # sellers are node indices; labels are kept for labelled graphs only
+        sizes = [len(G) for G in graphs]
+        nodePtr = np.zeros(len(graphs) + 1, dtype=np.int64)
+        nodePtr[1:] = np.cumsum(sizes)
+        edgePtr = np.zeros(len(graphs) + 1, dtype=np.int64)
+        edgePtr[1:] = np.cumsum([G.number_of_edges() for G in graphs])
+        labelled = [not isinstance(G.nodes, range) for G in graphs]
+        return {
+            'nodePtr': nodePtr,
+            'edgePtr': edgePtr,
+            'indptr': np.concatenate([G.indptr[1:] for G in graphs] or [np.zeros(0, dtype=np.int64)]),
+            'indices': np.concatenate([G.indices for G in graphs] or [np.zeros(0, dtype=np.int32)]),
+            'rindptr': np.concatenate([G.rindptr[1:] for G in graphs] or [np.zeros(0, dtype=np.int64)]),
+            'rindices': np.concatenate([G.rindices for G in graphs] or [np.zeros(0, dtype=np.int32)]),
+            'labelPtr': np.concatenate(([0], np.cumsum([n if l else 0 for n, l in zip(sizes, labelled)]))).astype(np.int64),
+            'labels': np.array([x for G, l in zip(graphs, labelled) if l for x in G.nodes], dtype=np.int64),
+            'sellers': np.array(sellers, dtype=np.int64),
+        }
+
+    def __len__(self):
+        return len(self.graphs)
+
+    def __getitem__(self, k: int) -> AuctionGraph:
+        G = self.graphs[k]
+        if G is None:
+            a = self.arrays
+            lo, hi = a['nodePtr'][k], a['nodePtr'][k + 1]
+            elo, ehi = a['edgePtr'][k], a['edgePtr'][k + 1]
+            # indptr rows are stored without their leading 0
+            indptr = np.concatenate(([0], a['indptr'][lo:hi]))
+            rindptr = np.concatenate(([0], a['rindptr'][lo:hi]))
+            nodes = None
+            if a['labelPtr'][k + 1] > a['labelPtr'][k]:
+                nodes = a['labels'][a['labelPtr'][k]:a['labelPtr'][k + 1]].tolist()
+            G = self.graphs[k] = AuctionGraph(indptr, a['indices'][elo:ehi], None, nodes,
+                rindptr = rindptr, rindices = a['rindices'][elo:ehi])
+        return G
+
+    def size(self, k: int) -> int:
+        return int(self.arrays['nodePtr'][k + 1] - self.arrays['nodePtr'][k])
+
+    def sellerLabels(self) -> List[Any]:
+        return [self[k].nodes[s] for k, s in enumerate(self.arrays['sellers'].tolist())]
+
+class GraphCache:
+    # A persistent content-addressed cache of pregenerated graphs, sellers and
+    # bid matrices. An entry is a directory of .npy files named by the hash of
+    # its key and is read back memory-mapped; beyond maxBytes the least
+    # recently used entries are evicted.
+    def __init__(self, directory: str, maxBytes: int = 1 << 30):
+        self.directory = directory
+        self.maxBytes = maxBytes
+
+    @staticmethod
+    def key(*parts) -> str:
+        return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        path = self.path(key)
+        try:
+            with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+                names = json.load(f)['arrays']
+            arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in names}
+        except (OSError, ValueError):
+            return None
+        os.utime(path)
+        return arrays
+
+    def put(self, key: str, arrays: Dict[str, np.ndarray], description: Any = None):
+        # written to a temporary directory first, so a reader never sees a
+        # partial entry; a concurrent writer of the same key simply loses
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key)
+        tmp = f'{path}.tmp{os.getpid()}'
+        os.makedirs(tmp, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp, name + '.npy'), np.ascontiguousarray(array))
+        with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'arrays': list(arrays), 'description': repr(description)}, f)
+        try:
+            os.replace(tmp, path)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors = True)
+        self.evict(keep = key)
+
+    def entries(self):
+        # (last use, bytes, key) of every complete entry
+        result = []
+        if not os.path.isdir(self.directory):
+            return result
+        for key in os.listdir(self.directory):
+            path = self.path(key)
+            if '.tmp' in key or not os.path.isdir(path):
+                continue
+            size = sum(os.path.getsize(os.path.join(path, x)) for x in os.listdir(path))
+            result.append((os.path.getmtime(path), size, key))
+        return result
+
+    def evict(self, keep: str = None):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.maxBytes:
+                break
+            if key != keep:
+                shutil.rmtree(self.path(key), ignore_errors = True)
+                total -= size
+
+    def getCorpus(self, key: str) -> Optional[GraphCorpus]:
+        arrays = self.get(key)
+        return None if arrays is None else GraphCorpus(arrays)
+
+    def putCorpus(self, key: str, graphs: List[AuctionGraph], sellers: List[int], description: Any = None):
+        self.put(key, GraphCorpus.pack(graphs, sellers), description)
+
+class TestGraphCache(unittest.TestCase):
+    def test_corpus(self):
+        graphs = [AuctionGraph.fromEdges(3, [0, 1], [1, 2]),
+            AuctionGraph.fromEdges(2, [1], [0], nodes = [7, 9]),
+            AuctionGraph.fromEdges(4, [0, 0, 3], [1, 3, 2])]
+        with tempfile.TemporaryDirectory() as directory:
+            cache = GraphCache(directory)
+            key = GraphCache.key('test', 1)
+            self.assertIsNone(cache.getCorpus(key))
+            cache.putCorpus(key, graphs, [0, 1, 3])
+            corpus = cache.getCorpus(key)
+            self.assertEqual(len(corpus), 3)
+            self.assertEqual(corpus.sellerLabels(), [0, 9, 3])
+            for G, H in zip(graphs, corpus):
+                self.assertEqual(list(G.nodes), list(H.nodes))
+                self.assertEqual(G.indptr.tolist(), H.indptr.tolist())
+                self.assertEqual(G.indices.tolist(), H.indices.tolist())
+                self.assertEqual(G.rindices.tolist(), H.rindices.tolist())
+
+    def test_evict(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = GraphCache(directory, maxBytes = 20000)
+            for k in range(3):
+                cache.put(str(k), {'bids': np.zeros(1000)})
+            self.assertIsNone(cache.get('0'))
+            self.assertIsNotNone(cache.get('2'))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,241 @@
+import numpy as np
+import queue
+import threading
+import time
+import unittest
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from mechanism.mechanismBase import DiffusionAuction
+from mechanism.auctionGraph import AuctionGraph
+from mechanism.topology import TopologyCache
+from graphgen.genBase import GraphGen
+from experiment.graphCache import GraphCache, describe
+from experiment.resultStore import RECORD
+from experiment.seeding import seedSequence
+
+class Trial:
+    # One trial of a graph configuration: its graph, seller and the bids of
+    # every distribution, row k holding the k-th distribution over the nodes.
+    __slots__ = ('gname', 'index', 'graph', 'seller', 'bids')
+
+    def __init__(self, gname: str, index: int, graph: AuctionGraph, seller: Any, bids: np.ndarray):
+        self.gname = gname
+        self.index = index
+        self.graph = graph
+        self.seller = seller
+        self.bids = bids
+
+def getSellerCandidates(graph: AuctionGraph) -> List[int]:
+    # nodes with at least the average degree and at least one out-edge
+    degree_threshold = graph.number_of_edges() / len(graph)
+    out_deg = graph.outDegree()
+    deg = graph.inDegree() + out_deg
+    return np.flatnonzero((deg >= degree_threshold) & (out_deg >= 1)).tolist()
+
+def chooseSeller(graph: AuctionGraph, rng: np.random.Generator) -> int:
+    candidates = getSellerCandidates(graph)
+    return candidates[rng.integers(len(candidates))]
+
+class TrialSource:
+    # Produces the trials of an experiment a block of blockSize trials at a
+    # time, so only one block is held in memory. The graph, seller and bids of
+    # a trial come from seeds of the trial alone (see experiment.seeding), the
+    # same for every configuration, so every configuration and mechanism sees
+    # common random numbers (a larger graph gets a longer prefix of the same
+    # bid stream). Blocks of graphs and bids are kept in the optional cache.
+    def __init__(self, seed: int = 0, blockSize: int = 50, cache: GraphCache = None):
+        self.seed = seed
+        self.blockSize = blockSize
+        self.cache = cache
+
+    def rngs(self, component: str, start: int, count: int) -> List[np.random.Generator]:
+        return [np.random.default_rng(seedSequence(self.seed, component, t)) for t in range(start, start + count)]
+
+    def cacheBlocks(self, start: int, count: int) -> Iterator[Tuple[int, int, int]]:
+        # the cache holds aligned blocks of blockSize trials, whatever the
+        # batches trials are run in: (block start, first, end) of every block
+        # part of start..start+count-1, first and end relative to the block
+        for blockStart in range(start - start % self.blockSize, start + count, self.blockSize):
+            yield blockStart, max(start, blockStart) - blockStart, min(start + count, blockStart + self.blockSize) - blockStart
+
+    def generateGraphs(self, graphgen: GraphGen, n: int, start: int, count: int) -> Tuple[List[AuctionGraph], List[int]]:
+        graphs = graphgen.getAuctionGraphs(n, self.rngs('graph', start, count))
+        return graphs, [chooseSeller(graph, rng) for graph, rng in zip(graphs, self.rngs('seller', start, count))]
+
+    def graphBlock(self, graphgen: GraphGen, n: int, start: int, count: int) -> Tuple[List[AuctionGraph], List[Any]]:
+        # graphs and sellers of trials start..start+count-1; a deterministic
+        # generator gives one shared read-only graph and only the seller varies
+        if graphgen.deterministic:
+            graph = graphgen.getAuctionGraph(n)
+            return [graph] * count, [graph.nodes[chooseSeller(graph, rng)] for rng in self.rngs('seller', start, count)]
+        if self.cache is None:
+            graphs, sellers = self.generateGraphs(graphgen, n, start, count)
+            return graphs, [graph.nodes[k] for graph, k in zip(graphs, sellers)]
+        graphs, sellers = [], []
+        for blockStart, first, end in self.cacheBlocks(start, count):
+            description = ('graphs', describe(graphgen), n, blockStart, self.blockSize, self.seed, 'per-trial seeds')
+            key = GraphCache.key(*description)
+            corpus = self.cache.getCorpus(key)
+            if corpus is None:
+                block, blockSellers = self.generateGraphs(graphgen, n, blockStart, self.blockSize)
+                self.cache.putCorpus(key, block, blockSellers, description)
+                part = list(zip(block, blockSellers))[first:end]
+            else:
+                part = [(corpus[k], int(corpus.arrays['sellers'][k])) for k in range(first, end)]
+            for graph, seller in part:
+                graphs.append(graph)
+                sellers.append(graph.nodes[seller])
+        return graphs, sellers
+
+    def generateBids(self, distribution: Any, start: int, count: int, width: int) -> np.ndarray:
+        bids = np.empty((count, width))
+        for r in range(count):
+            rng = np.random.default_rng(seedSequence(self.seed, 'bids', describe(distribution), start + r))
+            bids[r] = distribution.rvs(width, random_state = rng)
+        return bids
+
+    def bidBlock(self, distribution: Any, start: int, count: int, width: int) -> np.ndarray:
+        # a (count x width) matrix whose row r holds the bids of trial start + r;
+        # the bids of a trial are a prefix of its own stream, so a cached block
+        # of at least width columns serves any width
+        if self.cache is None:
+            return self.generateBids(distribution, start, count, width)
+        parts = []
+        for blockStart, first, end in self.cacheBlocks(start, count):
+            description = ('bids', describe(distribution), blockStart, self.blockSize, self.seed)
+            key = GraphCache.key(*description)
+            cached = self.cache.get(key)
+            if cached is None or cached['bids'].shape[1] < width:
+                bids = self.generateBids(distribution, blockStart, self.blockSize, width)
+                self.cache.put(key, {'bids': bids}, description)
+            else:
+                bids = cached['bids']
+            parts.append(bids[first:end, :width])
+        return np.concatenate(parts)
+
+    def blockTrials(self, gname: str, graphgen: GraphGen, n: int, distributions: Dict[str, Any],
+            start: int, count: int) -> Iterator[Trial]:
+        # the trials start..start+count-1 of one configuration
+        block, sellers = self.graphBlock(graphgen, n, start, count)
+        width = max(len(graph) for graph in block)
+        bids = [self.bidBlock(distribution, start, count, width) for distribution in distributions.values()]
+        for r in range(count):
+            graph = block[r]
+            trialBids = np.array([b[r, :len(graph)] for b in bids], dtype=np.float64)
+            yield Trial(gname, start + r, graph, sellers[r], trialBids)
+
+    def trials(self, graphs: Dict[str, Tuple[GraphGen, int]], distributions: Dict[str, Any],
+            count: int) -> Iterator[Trial]:
+        # block by block across the configurations, so the GNP of a sweep
+        # find the uniforms of a trial still cached
+        for start in range(0, count, self.blockSize):
+            size = min(self.blockSize, count - start)
+            for gname, (graphgen, n) in graphs.items():
+                yield from self.blockTrials(gname, graphgen, n, distributions, start, size)
+
+def evaluate(trial: Trial, mechanisms: Dict[str, DiffusionAuction], seed: int = 0,
+        topologyCache: TopologyCache = None) -> np.ndarray:
+    # a record of every (distribution, mechanism), distribution-major, with the
+    # graph code left 0 for the caller. The topology is computed once for all
+    # of them, and each mechanism's own randomness is seeded from the trial so
+    # results do not depend on the order trials are run in.
+    if topologyCache is None:
+        topologyCache = TopologyCache(maxsize = 1)
+    topology = topologyCache(trial.graph, trial.seller)
+    bids = trial.bids.copy()
+    bids[:, topology.root] = 1e-8
+    records = np.zeros((len(bids), len(mechanisms)), dtype=RECORD)
+    records['distribution'] = np.arange(len(bids))[:, None]
+    records['mechanism'] = np.arange(len(mechanisms))
+    records['trial'] = trial.index
+    records['seed'] = seed
+    records['seller'] = topology.root
+    for m, (mname, mechanism) in enumerate(mechanisms.items()):
+        mechanism.rng = np.random.default_rng(seedSequence(seed, 'mechanism', trial.gname, trial.index, mname))
+        started = time.perf_counter()
+        result = mechanism.runBatch(trial.graph, trial.seller, bids, topology)
+        records[:, m]['seconds'] = (time.perf_counter() - started) / len(bids)
+        records[:, m]['winner'] = result.winner
+        records[:, m]['revenue'] = result.revenue
+        records[:, m]['socialWelfare'] = result.socialWelfare
+        records[:, m]['optimal'] = result.Optimal
+    return records.ravel()
+
+def produce(items: Iterable, ready: queue.Queue, stop: threading.Event):
+    # put every item (then 'done', or the error) on ready, giving up once the
+    # consumer has stopped
+    def put(entry):
+        while not stop.is_set():
+            try:
+                ready.put(entry, timeout = 0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+    try:
+        for item in items:
+            if not put(('item', item)):
+                return
+        put(('done', None))
+    except BaseException as e:
+        put(('error', e))
+
+def prefetch(items: Iterable, depth: int = 0) -> Iterator:
+    # iterate items; with depth > 0 a thread produces them and keeps up to
+    # depth ready, so generation (largely NumPy, which releases the GIL)
+    # overlaps evaluation
+    if depth <= 0:
+        yield from items
+        return
+    ready = queue.Queue(maxsize = depth)
+    stop = threading.Event()
+    thread = threading.Thread(target = produce, args = (items, ready, stop), daemon = True)
+    thread.start()
+    try:
+        while True:
+            kind, item = ready.get()
+            if kind == 'done':
+                break
+            if kind == 'error':
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+def runTrials(source: TrialSource, graphs: Dict[str, Tuple[GraphGen, int]], distributions: Dict[str, Any],
+        mechanisms: Dict[str, DiffusionAuction], count: int, depth: int = 0,
+        topologyCache: Optional[TopologyCache] = None) -> Iterator[Tuple[Trial, np.ndarray]]:
+    # stream every trial through all mechanisms in this process, with up to
+    # depth trials generated ahead (see prefetch); each trial is discarded
+    # once it is reduced to its records
+    for trial in prefetch(source.trials(graphs, distributions, count), depth):
+        yield trial, evaluate(trial, mechanisms, source.seed, topologyCache)
+
+class TestPipeline(unittest.TestCase):
+    def test_prefetch(self):
+        import scipy.stats as stats
+        from graphgen.gnp import GNP
+        from graphgen.prices import Price_s
+        from mechanism.IDM import IDM
+        from mechanism.SCM import SCM
+        graphs = {'GNP': (GNP(0.1), 30), 'Price': (Price_s(m = 2), 30)}
+        distributions = {'uniform': stats.uniform(), 'powerlaw': stats.powerlaw(3)}
+        mechanisms = {'IDM': IDM(), 'SCM': SCM()}
+        runs = [np.concatenate([records for _, records in runTrials(TrialSource(1, 3), graphs, distributions,
+            mechanisms, 7, depth)]) for depth in (0, 1, 4)]
+        for records in runs[1:]:
+            for name in RECORD.names[:-1]:
+                self.assertTrue(np.array_equal(records[name], runs[0][name]), name)
+        # errors of the producer reach the consumer, and stopping early ends it
+        def failing():
+            yield 1
+            raise RuntimeError('generation failed')
+        with self.assertRaises(RuntimeError):
+            list(prefetch(failing(), 2))
+        items = prefetch(iter(range(100)), 2)
+        self.assertEqual(next(items), 0)
+        items.close()
+
+if __name__ == "__main__":
+    unittest.main()
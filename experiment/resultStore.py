@@ -0,0 +1,334 @@
+import json
+import numpy as np
+import os
+import sys
+import tempfile
+import unittest
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# One record per (graph configuration, distribution, mechanism, trial). The
+# first three are codes into the category tables of the shard; seller and
+# winner are node indices of the graph, and seconds is the mechanism's time
+# on the trial divided evenly over the distributions it ran on.
+RECORD = np.dtype([
+    ('graph', '<i4'),
+    ('distribution', '<i4'),
+    ('mechanism', '<i4'),
+    ('trial', '<i8'),
+    ('seed', '<i8'),
+    ('seller', '<i8'),
+    ('winner', '<i8'),
+    ('revenue', '<f8'),
+    ('socialWelfare', '<f8'),
+    ('optimal', '<f8'),
+    ('seconds', '<f8'),
+])
+CATEGORIES = ('graph', 'distribution', 'mechanism')
+FORMAT = 'diffusion-auction-results'
+VERSION = 1
+
+# A shard is a directory holding one raw little-endian file per column
+# (<name>.bin) and schema.json with the format, row count, column dtypes,
+# category tables and free-form metadata. Columns are appended a chunk at a
+# time and schema.json is replaced after each chunk, so the row count it
+# records only ever covers complete rows; readers memory-map the columns.
+
+def readSchema(directory: str) -> Dict[str, Any]:
+    with open(os.path.join(directory, 'schema.json'), encoding='utf-8') as f:
+        schema = json.load(f)
+    if schema.get('format') != FORMAT:
+        raise ValueError(f'{directory} is not a result shard')
+    if schema['version'] > VERSION:
+        raise ValueError(f'{directory} has result format version {schema["version"]}')
+    return schema
+
+def writeSchema(directory: str, schema: Dict[str, Any]):
+    tmp = os.path.join(directory, f'schema.json.tmp{os.getpid()}')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(schema, f, indent=1)
+    os.replace(tmp, os.path.join(directory, 'schema.json'))
+
+class ResultWriter:
+    # Appends records to a shard, creating it or continuing an existing one
+    # with the same columns; bytes past the recorded row count (from an
+    # interrupted write) are discarded. Records are coded by the given
+    # categories; names the shard does not have yet are added to its tables
+    # and codes are translated to the shard's, so a continued run may add or
+    # reorder graphs, distributions and mechanisms.
+    def __init__(self, directory: str, categories: Dict[str, Sequence[str]],
+            meta: Optional[Dict[str, Any]] = None, chunkSize: int = 1 << 14):
+        self.directory = directory
+        self.chunkSize = chunkSize
+        self.pending: List[np.ndarray] = []
+        self.pendingRows = 0
+        columns = [{'name': name, 'dtype': RECORD[name].str} for name in RECORD.names]
+        if os.path.exists(os.path.join(directory, 'schema.json')):
+            self.schema = readSchema(directory)
+            if self.schema['columns'] != columns:
+                raise ValueError(f'{directory} has different columns')
+            for name in RECORD.names:
+                with open(self.columnFile(name), 'ab') as f:
+                    f.truncate(self.schema['rows'] * RECORD[name].itemsize)
+            self.schema['meta'].update(meta or {})
+        else:
+            os.makedirs(directory, exist_ok=True)
+            self.schema = {'format': FORMAT, 'version': VERSION, 'rows': 0, 'columns': columns,
+                'categories': {name: [] for name in CATEGORIES}, 'meta': meta or {}}
+            for name in RECORD.names:
+                open(self.columnFile(name), 'wb').close()
+        self.recode = {}
+        for category in CATEGORIES:
+            table = self.schema['categories'][category]
+            table.extend(name for name in categories[category] if name not in table)
+            self.recode[category] = np.array([table.index(name) for name in categories[category]], dtype=np.int32)
+        writeSchema(directory, self.schema)
+
+    def columnFile(self, name: str) -> str:
+        return os.path.join(self.directory, name + '.bin')
+
+    @property
+    def rows(self) -> int:
+        return self.schema['rows'] + self.pendingRows
+
+    def append(self, records: np.ndarray):
+        records = np.array(records, dtype=RECORD)
+        for category in CATEGORIES:
+            if len(records):
+                records[category] = self.recode[category][records[category]]
+        self.pending.append(records)
+        self.pendingRows += len(records)
+        if self.pendingRows >= self.chunkSize:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        chunk = np.concatenate(self.pending)
+        for name in RECORD.names:
+            with open(self.columnFile(name), 'ab') as f:
+                f.write(np.ascontiguousarray(chunk[name]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        self.schema['rows'] += len(chunk)
+        writeSchema(self.directory, self.schema)
+        self.pending.clear()
+        self.pendingRows = 0
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+class ResultShard:
+    # A read-only shard whose columns are memory-mapped on first use.
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.schema = readSchema(directory)
+        self.rows: int = self.schema['rows']
+        self.categories: Dict[str, List[str]] = self.schema['categories']
+        self.meta: Dict[str, Any] = self.schema['meta']
+        self.columns: Dict[str, np.ndarray] = {}
+
+    def __len__(self):
+        return self.rows
+
+    def column(self, name: str) -> np.ndarray:
+        array = self.columns.get(name)
+        if array is None:
+            dtype = next(c['dtype'] for c in self.schema['columns'] if c['name'] == name)
+            if self.rows == 0:
+                array = np.zeros(0, dtype=dtype)
+            else:
+                array = np.memmap(os.path.join(self.directory, name + '.bin'), dtype=dtype,
+                    mode='r', shape=(self.rows,))
+            self.columns[name] = array
+        return array
+
+class ResultSet:
+    # Any number of shards read as one table. Category codes are local to a
+    # shard, so filters and groups are given and returned by name, and every
+    # shard is processed chunkSize rows at a time.
+    def __init__(self, directories: Sequence[str], chunkSize: int = 1 << 20):
+        self.shards = [ResultShard(directory) for directory in directories]
+        self.chunkSize = chunkSize
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+    def names(self, category: str) -> List[str]:
+        # the names of a category over all shards, in order of appearance
+        result = {}
+        for shard in self.shards:
+            result.update(dict.fromkeys(shard.categories[category]))
+        return list(result)
+
+    def chunks(self, columns: Sequence[str], where: Dict[str, Any]) -> Iterator[Tuple[ResultShard, Dict[str, np.ndarray]]]:
+        # the given columns of the rows matching where (category names, or
+        # lists of them), one chunk of one shard at a time
+        for shard in self.shards:
+            allowed = {}
+            for category, value in where.items():
+                wanted = [value] if isinstance(value, str) else list(value)
+                allowed[category] = [code for code, name in enumerate(shard.categories[category]) if name in wanted]
+            for lo in range(0, len(shard), self.chunkSize):
+                hi = min(lo + self.chunkSize, len(shard))
+                mask = np.ones(hi - lo, dtype=bool)
+                for category, codes in allowed.items():
+                    mask &= np.isin(shard.column(category)[lo:hi], codes)
+                if mask.any():
+                    yield shard, {name: np.asarray(shard.column(name)[lo:hi])[mask] for name in columns}
+
+    def recoded(self, columns: Sequence[str], categories: Dict[str, Sequence[str]]) -> Iterator[Dict[str, np.ndarray]]:
+        # chunks of the given columns with each category coded by its position
+        # in categories[category] (-1 if it is not there) instead of the shard's
+        for shard, chunk in self.chunks(columns, {}):
+            for category in CATEGORIES:
+                if category in chunk:
+                    index = {name: k for k, name in enumerate(categories[category])}
+                    table = np.array([index.get(name, -1) for name in shard.categories[category]], dtype=np.int64)
+                    chunk[category] = table[chunk[category]]
+            yield chunk
+
+    def select(self, columns: Sequence[str] = RECORD.names, **where) -> Dict[str, np.ndarray]:
+        # the matching rows loaded into memory; categories come back as names
+        parts = {name: [] for name in columns}
+        for shard, chunk in self.chunks(columns, where):
+            for name in columns:
+                values = chunk[name]
+                if name in CATEGORIES:
+                    values = np.array(shard.categories[name], dtype=object)[values]
+                parts[name].append(values)
+        return {name: np.concatenate(values) if values else np.zeros(0, dtype=object if name in CATEGORIES else RECORD[name])
+            for name, values in parts.items()}
+
+    def checkUnique(self):
+        # raise if two rows are the same trial of the same cell, e.g. of shards
+        # that overlap, which would count the trial twice
+        columns = CATEGORIES + ('trial',)
+        categories = {name: self.names(name) for name in CATEGORIES}
+        parts = [np.stack([chunk[name] for name in columns]) for chunk in self.recoded(columns, categories)]
+        if not parts:
+            return
+        keys = np.concatenate(parts, axis=1)
+        keys = keys[:, np.lexsort(keys)]
+        repeated = np.flatnonzero((keys[:, 1:] == keys[:, :-1]).all(axis=0))
+        if len(repeated):
+            g, d, m, trial = keys[:, repeated[0]].tolist()
+            raise ValueError(f'{len(repeated)} duplicate records, e.g. trial {trial} of '
+                f'{categories["graph"][g]} {categories["distribution"][d]} {categories["mechanism"][m]}')
+
+    def aggregate(self, by: Sequence[str] = CATEGORIES, values: Sequence[str] = ('socialWelfare', 'revenue', 'optimal'),
+            **where) -> Dict[Tuple[str, ...], Dict[str, float]]:
+        # sums of values and the row count of every group of category names
+        self.checkUnique()
+        result: Dict[Tuple[str, ...], Dict[str, float]] = {}
+        for shard, chunk in self.chunks(list(by) + list(values), where):
+            sizes = [len(shard.categories[name]) for name in by]
+            group = np.ravel_multi_index([chunk[name] for name in by], sizes) if by else np.zeros(len(chunk[values[0]]), dtype=np.int64)
+            total = int(np.prod(sizes))
+            counts = np.bincount(group, minlength=total)
+            sums = {name: np.bincount(group, weights=chunk[name], minlength=total) for name in values}
+            for g in np.flatnonzero(counts).tolist():
+                codes = np.unravel_index(g, sizes) if by else ()
+                key = tuple(shard.categories[name][int(code)] for name, code in zip(by, codes))
+                entry = result.setdefault(key, {**dict.fromkeys(values, 0.0), 'count': 0})
+                for name in values:
+                    entry[name] += float(sums[name][g])
+                entry['count'] += int(counts[g])
+        return result
+
+    def merge(self, directory: str, meta: Optional[Dict[str, Any]] = None):
+        # write all shards into one new shard with the union of their
+        # categories, its records sorted by graph, trial, distribution and
+        # mechanism: shards that together hold the same records merge into
+        # the same shard, whatever the order of the shards and their rows.
+        # The records are sorted in memory; shards that overlap are refused.
+        self.checkUnique()
+        categories = {name: self.names(name) for name in CATEGORIES}
+        records = np.empty(len(self), dtype=RECORD)
+        lo = 0
+        for chunk in self.recoded(RECORD.names, categories):
+            hi = lo + len(chunk['trial'])
+            for name in RECORD.names:
+                records[name][lo:hi] = chunk[name]
+            lo = hi
+        records = records[np.lexsort([records[name] for name in ('mechanism', 'distribution', 'trial', 'graph')])]
+        if meta is None:
+            meta = self.shards[0].meta if self.shards else {}
+        with ResultWriter(directory, categories, meta, chunkSize = self.chunkSize) as writer:
+            for lo in range(0, len(records), self.chunkSize):
+                writer.append(records[lo:lo + self.chunkSize])
+
+def summary(results: ResultSet) -> List[str]:
+    # normalized social welfare and revenue of every (graph, distribution, mechanism)
+    lines = []
+    groups = results.aggregate()
+    order = [{name: k for k, name in enumerate(results.names(category))} for category in CATEGORIES]
+    for gname, dname, mname in sorted(groups, key = lambda key: [o[x] for o, x in zip(order, key)]):
+        entry = groups[gname, dname, mname]
+        lines.append(f'{gname} {dname} {mname}, Normlized SW {entry["socialWelfare"] / entry["optimal"]:.4f}, '
+            f'normalized revenue {entry["revenue"] / entry["optimal"]:.4f}, trials {entry["count"]}')
+    return lines
+
+class TestResultStore(unittest.TestCase):
+    def records(self, graph, trials, revenue):
+        records = np.zeros(len(trials), dtype=RECORD)
+        records['graph'] = graph
+        records['trial'] = trials
+        records['revenue'] = revenue
+        records['optimal'] = 1
+        return records
+
+    def test_append_merge(self):
+        with tempfile.TemporaryDirectory() as directory:
+            a, b = os.path.join(directory, 'a'), os.path.join(directory, 'b')
+            categories = {'graph': ['G', 'H'], 'distribution': ['u'], 'mechanism': ['IDM']}
+            with ResultWriter(a, categories, chunkSize = 2) as writer:
+                writer.append(self.records(0, [0, 1, 2], 1.0))
+                writer.append(self.records(1, [0], 2.0))
+            # continuing a shard keeps its rows, and may reorder or add names
+            with ResultWriter(a, {'graph': ['H', 'G'], 'distribution': ['u'], 'mechanism': ['IDM', 'SCM']}) as writer:
+                writer.append(self.records(0, [1], 2.0))
+            self.assertEqual(ResultShard(a).categories['mechanism'], ['IDM', 'SCM'])
+            with ResultWriter(b, {'graph': ['H'], 'distribution': ['u'], 'mechanism': ['IDM']}) as writer:
+                writer.append(self.records(0, [2, 3], 4.0))
+            results = ResultSet([a, b], chunkSize = 3)
+            self.assertEqual(len(results), 7)
+            self.assertEqual(results.names('graph'), ['G', 'H'])
+            groups = results.aggregate(by = ('graph',), values = ('revenue',))
+            self.assertEqual(groups, {('G',): {'revenue': 3.0, 'count': 3}, ('H',): {'revenue': 12.0, 'count': 4}})
+            self.assertEqual(sorted(results.select(('trial',), graph = 'H')['trial'].tolist()), [0, 1, 2, 3])
+            merged = os.path.join(directory, 'merged')
+            results.merge(merged)
+            self.assertEqual(ResultSet([merged]).aggregate(by = ('graph',), values = ('revenue',)), groups)
+            # the same trials twice, e.g. two runs of the same shard
+            with self.assertRaises(ValueError):
+                ResultSet([a, b, b]).merge(os.path.join(directory, 'twice'))
+            with self.assertRaises(ValueError):
+                ResultSet([merged, a]).aggregate()
+
+    def test_interrupted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            categories = {'graph': ['G'], 'distribution': ['u'], 'mechanism': ['IDM']}
+            with ResultWriter(directory, categories) as writer:
+                writer.append(self.records(0, [0, 1], 1.0))
+            # a chunk whose schema update never happened
+            with open(os.path.join(directory, 'trial.bin'), 'ab') as f:
+                f.write(b'\x01' * 8)
+            self.assertEqual(len(ResultShard(directory)), 2)
+            with ResultWriter(directory, categories) as writer:
+                writer.append(self.records(0, [2], 1.0))
+            self.assertEqual(ResultShard(directory).column('trial').tolist(), [0, 1, 2])
+
+if __name__ == "__main__":
+    # python -m experiment.resultStore data/results*
+    # python -m experiment.resultStore --merge target data/results*
+    if sys.argv[1:2] == ['--merge']:
+        ResultSet(sys.argv[3:]).merge(sys.argv[2])
+    else:
+        for line in summary(ResultSet(sys.argv[1:])):
+            print(line)
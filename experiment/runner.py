@@ -0,0 +1,372 @@
+import itertools
+import multiprocessing
+import numpy as np
+import os
+import queue
+import tempfile
+import threading
+import time
+import unittest
+import scipy.stats as stats
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from mechanism.mechanismBase import DiffusionAuction
+from mechanism.topology import TopologyCache
+from graphgen.genBase import GraphGen
+from experiment.aggregator import Aggregator
+from experiment.graphCache import describe
+from experiment.pipeline import Trial, TrialSource, evaluate, prefetch, runTrials
+from experiment.resultStore import CATEGORIES, RECORD, ResultSet, ResultShard, ResultWriter
+from experiment.scheduler import CostModel, Scheduler, Task, Unit
+
+def workUnits(graphs: Dict[str, Tuple[GraphGen, int]], count: int, blockSize: int) -> List[Unit]:
+    # block by block across the configurations, so the pool works through
+    # the trials roughly in order
+    return [(gname, start, min(blockSize, count - start))
+        for start in range(0, count, blockSize) for gname in graphs]
+
+def completed(directory: str, graphs: Dict[str, Any], distributions: Dict[str, Any],
+        mechanisms: Dict[str, Any], count: int) -> np.ndarray:
+    # done[g, d, m, t] is True if the shard at directory already has the
+    # record of trial t in the cell (g, d, m) of this experiment
+    done = np.zeros((len(graphs), len(distributions), len(mechanisms), count), dtype=bool)
+    if not os.path.exists(os.path.join(directory, 'schema.json')):
+        return done
+    categories = {'graph': list(graphs), 'distribution': list(distributions), 'mechanism': list(mechanisms)}
+    for chunk in ResultSet([directory]).recoded(CATEGORIES + ('trial',), categories):
+        g, d, m, trial = chunk['graph'], chunk['distribution'], chunk['mechanism'], chunk['trial']
+        keep = (g >= 0) & (d >= 0) & (m >= 0) & (trial < count)
+        done[g[keep], d[keep], m[keep], trial[keep]] = True
+    return done
+
+def pendingTasks(units: List[Unit], done: np.ndarray, graphs: Dict[str, Any], distributions: Dict[str, Any],
+        mechanisms: Dict[str, Any]) -> List[Task]:
+    # for every unfinished unit, the distributions and mechanisms that have a
+    # missing cell; finished units are left out, so their graphs are never built
+    gindex = {gname: g for g, gname in enumerate(graphs)}
+    dnames, mnames = list(distributions), list(mechanisms)
+    tasks = []
+    for unit in units:
+        gname, start, count = unit
+        missing = ~done[gindex[gname], :, :, start:start + count].all(axis=2)
+        if missing.any():
+            tasks.append((unit, tuple(dnames[d] for d in np.flatnonzero(missing.any(axis=1))),
+                tuple(mnames[m] for m in np.flatnonzero(missing.any(axis=0)))))
+    return tasks
+
+# the state of a worker process, set once by initWorker: the trial source, the
+# configurations with their generators (and loaded graphs), the distributions
+# and mechanisms, and a topology cache kept warm across the units of the worker
+worker: Dict[str, Any] = {}
+
+def initWorker(source: TrialSource, graphs: Dict[str, Tuple[GraphGen, int]], distributions: Dict[str, Any],
+        mechanisms: Dict[str, DiffusionAuction], topologyCacheSize: int):
+    worker.clear()
+    worker.update(source = source, graphs = graphs, distributions = distributions,
+        mechanisms = mechanisms, topologyCache = TopologyCache(maxsize = topologyCacheSize))
+
+def unitTrials(task: Task) -> Iterator[Trial]:
+    (gname, start, count), dnames, _ = task
+    graphgen, n = worker['graphs'][gname]
+    distributions = {dname: worker['distributions'][dname] for dname in dnames}
+    return worker['source'].blockTrials(gname, graphgen, n, distributions, start, count)
+
+def evaluateUnit(task: Task, trials: Iterable[Trial]) -> Tuple[np.ndarray, float]:
+    # the records of the trials of the unit for the distributions and
+    # mechanisms of the task, trial by trial, coded as in the whole experiment,
+    # and the mean size of their graphs
+    (gname, _, _), dnames, mnames = task
+    mechanisms = {mname: worker['mechanisms'][mname] for mname in mnames}
+    records, sizes = [], []
+    for trial in trials:
+        records.append(evaluate(trial, mechanisms, worker['source'].seed, worker['topologyCache']))
+        sizes.append(trial.graph.number_of_nodes() + trial.graph.number_of_edges())
+    records = np.concatenate(records)
+    records['graph'] = list(worker['graphs']).index(gname)
+    records['distribution'] = np.array([list(worker['distributions']).index(d) for d in dnames])[records['distribution']]
+    records['mechanism'] = np.array([list(worker['mechanisms']).index(m) for m in mnames])[records['mechanism']]
+    return records, float(np.mean(sizes))
+
+def runUnit(task: Task) -> Tuple[Task, np.ndarray, float, float]:
+    # the records of the unit (see evaluateUnit) with the wall time of the task
+    began = time.perf_counter()
+    records, size = evaluateUnit(task, unitTrials(task))
+    return task, records, time.perf_counter() - began, size
+
+def scheduledTrials(scheduler: Scheduler, lock: threading.Lock) -> Iterator[Tuple[Task, Trial]]:
+    # the trials of the tasks in the order the scheduler hands them out
+    while True:
+        with lock:
+            if not len(scheduler):
+                return
+            task = scheduler.next()
+        for trial in unitTrials(task):
+            yield task, trial
+
+def runUnits(source: TrialSource, graphs: Dict[str, Tuple[GraphGen, int]], distributions: Dict[str, Any],
+        mechanisms: Dict[str, DiffusionAuction], count: int, processes: Optional[int] = None,
+        topologyCacheSize: int = 64, done: Optional[np.ndarray] = None, depth: int = 0) -> Iterator[Tuple[Unit, np.ndarray]]:
+    # run every work unit on a pool of processes (all cores by default, 1 runs
+    # in this process, generating up to depth trials ahead as in runTrials)
+    # and yield (unit, records) as units finish. A Scheduler
+    # hands out the costliest pending task first and splits the costliest
+    # blocks into smaller batches of trials, so the run ends close to the
+    # total work over the processes; its estimates are refined by every
+    # finished unit. Every trial is seeded on its own, so its records do not
+    # depend on the batch or worker that ran it, and the merged records are
+    # the same for any pool. With done (see completed) only the unfinished
+    # cells are run, though a unit may still return records of its finished
+    # trials.
+    units = workUnits(graphs, count, source.blockSize)
+    if done is None:
+        done = np.zeros((len(graphs), len(distributions), len(mechanisms), count), dtype=bool)
+    tasks = pendingTasks(units, done, graphs, distributions, mechanisms)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = max(min(processes, len(tasks)), 1)
+    # batches of a block read their trials from the whole block in the cache
+    # of the source (see TrialSource.cacheBlocks)
+    scheduler = Scheduler(tasks, CostModel({gname: n for gname, (_, n) in graphs.items()}), processes,
+        minBatch = max(1, source.blockSize // 5))
+    args = (source, graphs, distributions, mechanisms, topologyCacheSize)
+    if processes <= 1:
+        # with a depth the trials of the next tasks are generated ahead in a
+        # thread, and the elapsed time of a unit is its evaluation
+        initWorker(*args)
+        lock = threading.Lock()
+        trials = prefetch(scheduledTrials(scheduler, lock), depth)
+        for task, trial in trials:
+            began = time.perf_counter()
+            rest = (trial for _, trial in itertools.islice(trials, task[0][2] - 1))
+            records, size = evaluateUnit(task, itertools.chain([trial], rest))
+            with lock:
+                scheduler.finished(task, records, time.perf_counter() - began, size, list(mechanisms))
+            yield task[0], records
+        return
+    finished = queue.Queue()
+    with multiprocessing.Pool(processes, initializer = initWorker, initargs = args) as pool:
+        running = 0
+        while running or len(scheduler):
+            # keep every process busy, deciding on the next task only when
+            # one is free so it is chosen with the latest estimates
+            while running < processes and len(scheduler):
+                pool.apply_async(runUnit, (scheduler.next(),), callback = finished.put,
+                    error_callback = finished.put)
+                running += 1
+            result = finished.get()
+            running -= 1
+            if isinstance(result, BaseException):
+                raise result
+            task, records, elapsed, size = result
+            scheduler.finished(task, records, elapsed, size, list(mechanisms))
+            yield task[0], records
+
+def runExperiment(source: TrialSource, graphs: Dict[str, Tuple[GraphGen, int]], distributions: Dict[str, Any],
+        mechanisms: Dict[str, DiffusionAuction], count: int, directory: str, processes: Optional[int] = None,
+        topologyCacheSize: int = 64, skip: Optional[np.ndarray] = None, aggregator: Optional[Aggregator] = None,
+        shard: Tuple[int, int] = (0, 1), depth: int = 0):
+    # run the experiment into the result shard at directory. Every finished
+    # unit is flushed to the shard at once, which is the checkpoint: a run
+    # into an existing shard skips the cells it already holds, including
+    # those of an interrupted run, and computes only the missing ones (e.g.
+    # of a newly added mechanism). Units are seeded from their position alone,
+    # so there is no other generator state to restore. skip[g, d, m, t] leaves
+    # out more trials, and the new records are also fed to the aggregator.
+    # shard = (k, K) runs every K-th unit from the k-th only; as every trial is
+    # seeded on its own, the K shards can run anywhere and ResultSet.merge
+    # gives the same records as a run of them all.
+    categories = {'graph': list(graphs), 'distribution': list(distributions), 'mechanism': list(mechanisms)}
+    descriptions = {gname: [describe(graphgen), n] for gname, (graphgen, n) in graphs.items()}
+    meta = {'seed': source.seed, 'trials': count, 'blockSize': source.blockSize, 'graphs': descriptions,
+        'distributions': {dname: describe(distribution) for dname, distribution in distributions.items()}}
+    if os.path.exists(os.path.join(directory, 'schema.json')):
+        previous = ResultShard(directory).meta
+        for key in ('seed', 'blockSize'):
+            if previous.get(key, meta[key]) != meta[key]:
+                raise ValueError(f'{directory} was run with {key} {previous[key]}, not {meta[key]}')
+        for kind in ('graphs', 'distributions'):
+            for name, description in meta[kind].items():
+                if previous.get(kind, {}).get(name, description) != description:
+                    raise ValueError(f'{directory} has a different {name}')
+        meta['graphs'] = {**previous.get('graphs', {}), **meta['graphs']}
+        meta['distributions'] = {**previous.get('distributions', {}), **meta['distributions']}
+    done = completed(directory, graphs, distributions, mechanisms, count)
+    if skip is not None:
+        done |= skip
+    index, shards = shard
+    gindex = {gname: g for g, gname in enumerate(graphs)}
+    for k, (gname, start, size) in enumerate(workUnits(graphs, count, source.blockSize)):
+        if k % shards != index:
+            done[gindex[gname], :, :, start:start + size] = True
+    with ResultWriter(directory, categories, meta) as writer:
+        for _, records in runUnits(source, graphs, distributions, mechanisms, count, processes,
+                topologyCacheSize, done, depth):
+            records = records[~done[records['graph'], records['distribution'], records['mechanism'], records['trial']]]
+            writer.append(records)
+            writer.flush()
+            if aggregator is not None:
+                aggregator.add(records)
+
+def runAdaptive(source: TrialSource, graphs: Dict[str, Tuple[GraphGen, int]], distributions: Dict[str, Any],
+        mechanisms: Dict[str, DiffusionAuction], width: float, minTrials: int, maxTrials: int, directory: str,
+        processes: Optional[int] = None, topologyCacheSize: int = 64, shard: Tuple[int, int] = (0, 1),
+        depth: int = 0) -> Aggregator:
+    # run every cell until the confidence intervals of its normalized SW and
+    # revenue are at most width wide, with between minTrials and maxTrials
+    # trials. Each round gives every open cell the whole blocks its interval is
+    # projected to need (at least one, and at most doubling its trials so the
+    # projection is refined), and cells whose ratio settles early stop early. The trials
+    # of a cell are always 0..n-1, so a run into an existing shard resumes.
+    # With shard = (k, K) only the units of shard k are run (see runExperiment)
+    # and every shard stops a cell on its own trials: the trials of a cell are
+    # then the first n of those its units hold.
+    aggregator = Aggregator(graphs, distributions, mechanisms)
+    if os.path.exists(os.path.join(directory, 'schema.json')):
+        aggregator.addResults(ResultSet([directory]))
+    block = source.blockSize
+    index, shards = shard
+    gindex = {gname: g for g, gname in enumerate(graphs)}
+    owned = np.zeros((len(graphs), maxTrials), dtype=bool)
+    for k, (gname, start, size) in enumerate(workUnits(graphs, maxTrials, block)):
+        if k % shards == index:
+            owned[gindex[gname], start:start + size] = True
+    # rank[g, t] is the number of trials of the shard among 0..t of graph g
+    rank = owned.cumsum(axis=1)[:, None, None, :]
+    available = rank[..., -1]
+    while True:
+        n = completed(directory, graphs, distributions, mechanisms, maxTrials).sum(axis=3)
+        pending = (n < minTrials) | ~aggregator.converged(width)
+        with np.errstate(invalid='ignore'):
+            needed = np.nan_to_num(aggregator.trialsNeeded(width), nan=maxTrials, posinf=maxTrials)
+        target = np.maximum(np.minimum(needed, 2 * n), n + block)
+        target = np.maximum(-(-target // block) * block, minTrials)
+        target = np.where(pending, np.minimum(target, available), n).astype(np.int64)
+        if not (target > n).any():
+            return aggregator
+        runExperiment(source, graphs, distributions, mechanisms, maxTrials, directory, processes,
+            topologyCacheSize, ~owned[:, None, None, :] | (rank > target[..., None]), aggregator, shard, depth)
+
+class TestRunner(unittest.TestCase):
+    def test_deterministic(self):
+        from graphgen.gnp import GNP, GNPSweep
+        from graphgen.prices import Price_s
+        from mechanism.IDM import IDM
+        from mechanism.SCM import SCM
+        sweep = GNPSweep()
+        graphs = {'GNP 0.1': (GNP(0.1, sweep = sweep), 30), 'GNP 0.3': (GNP(0.3, sweep = sweep), 30),
+            'GNP': (GNP(0.1), 30), 'Price': (Price_s(m = 2), 30)}
+        distributions = {'uniform': stats.uniform(), 'powerlaw': stats.powerlaw(3)}
+        mechanisms = {'IDM': IDM(), 'SCM': SCM()}
+        serial = []
+        for trial, records in runTrials(TrialSource(1, 3), graphs, distributions, mechanisms, 7):
+            records['graph'] = list(graphs).index(trial.gname)
+            serial.append(records)
+        serial = np.concatenate(serial)
+        order = lambda records: records[np.lexsort([records[name] for name in ('mechanism', 'distribution', 'trial', 'graph')])]
+        serial = order(serial)
+        for processes, depth in ((1, 0), (1, 5), (2, 0)):
+            records = order(np.concatenate([r for _, r in runUnits(TrialSource(1, 3), graphs, distributions, mechanisms, 7,
+                processes, depth = depth)]))
+            # everything but the timings, in any order of the units
+            for name in RECORD.names[:-1]:
+                self.assertTrue(np.array_equal(records[name], serial[name]), name)
+
+    def test_cached_batches(self):
+        from experiment.graphCache import GraphCache
+        from graphgen.gnp import GNP
+        from mechanism.IDM import IDM
+        graphs = {'GNP': (GNP(0.1), 30), 'GNP 0.2': (GNP(0.2), 30)}
+        distributions = {'uniform': stats.uniform()}
+        order = lambda records: records[np.lexsort([records[name] for name in ('mechanism', 'distribution', 'trial', 'graph')])]
+        serial = order(np.concatenate([records for _, records in runUnits(TrialSource(5, 10), graphs, distributions,
+            {'IDM': IDM()}, 20, 1)]))
+        with tempfile.TemporaryDirectory() as directory:
+            cache = GraphCache(directory)
+            for run in range(2):
+                # with the cache on, a pool still splits its blocks into batches,
+                # the cache keeps whole blocks, and the records are the same
+                units = list(runUnits(TrialSource(5, 10, cache), graphs, distributions, {'IDM': IDM()}, 20, 2))
+                self.assertTrue(any(count < 10 for (_, _, count), _ in units))
+                records = order(np.concatenate([records for _, records in units]))
+                for name in RECORD.names[:-1]:
+                    self.assertTrue(np.array_equal(records[name], serial[name]), name)
+                self.assertEqual(len(cache.entries()), 2 * 2 + 2)
+
+    def test_resume(self):
+        from graphgen.gnp import GNP
+        from mechanism.IDM import IDM
+        from mechanism.NSP import NSP
+        graphs = {'GNP': (GNP(0.1), 30)}
+        distributions = {'uniform': stats.uniform()}
+        with tempfile.TemporaryDirectory() as directory:
+            full, part = os.path.join(directory, 'full'), os.path.join(directory, 'part')
+            runExperiment(TrialSource(2, 2), graphs, distributions, {'IDM': IDM(), 'NSP': NSP()}, 5, full, 1)
+            # a run stopped after its first unit, resumed with a mechanism added
+            units = runUnits(TrialSource(2, 2), graphs, distributions, {'IDM': IDM()}, 5, 1)
+            with ResultWriter(part, {'graph': ['GNP'], 'distribution': ['uniform'], 'mechanism': ['IDM']}) as writer:
+                writer.append(next(units)[1])
+            done = completed(part, graphs, distributions, {'NSP': NSP(), 'IDM': IDM()}, 5)
+            self.assertEqual(done[0, 0].sum(axis=1).tolist(), [0, 2])
+            runExperiment(TrialSource(2, 2), graphs, distributions, {'NSP': NSP(), 'IDM': IDM()}, 5, part, 1)
+            self.assertEqual(len(ResultShard(part)), 10)
+            fields = ('revenue', 'socialWelfare', 'winner')
+            self.assertEqual(ResultSet([part]).aggregate(values = fields), ResultSet([full]).aggregate(values = fields))
+            with self.assertRaises(ValueError):
+                runExperiment(TrialSource(3, 2), graphs, distributions, {'IDM': IDM()}, 5, part, 1)
+
+    def test_adaptive(self):
+        from graphgen.gnp import GNP
+        from mechanism.IDM import IDM
+        from mechanism.NSP import NSP
+        graphs = {'GNP': (GNP(0.1), 30), 'GNP 0.3': (GNP(0.3), 30)}
+        distributions = {'uniform': stats.uniform()}
+        mechanisms = {'IDM': IDM(), 'NSP': NSP()}
+        with tempfile.TemporaryDirectory() as directory:
+            loose = runAdaptive(TrialSource(2, 4), graphs, distributions, mechanisms, 10.0, 6, 40,
+                os.path.join(directory, 'loose'), 1)
+            self.assertEqual(loose.count.tolist(), [[[6, 6]], [[6, 6]]])
+            tight = runAdaptive(TrialSource(2, 4), graphs, distributions, mechanisms, 0.05, 6, 40,
+                os.path.join(directory, 'tight'), 1)
+            # every cell either reached the width or ran out of trials, and
+            # its trials are 0..n-1
+            self.assertTrue((tight.converged(0.05) | (tight.count == 40)).all())
+            done = completed(os.path.join(directory, 'tight'), graphs, distributions, mechanisms, 40)
+            self.assertEqual(done.sum(axis=3).tolist(), tight.count.tolist())
+            self.assertTrue((done.cumprod(axis=3).sum(axis=3) == tight.count).all())
+            # two shards, each on the blocks of its units, merge without overlap
+            for k in (0, 1):
+                runAdaptive(TrialSource(2, 4), graphs, distributions, mechanisms, 0.05, 6, 40,
+                    os.path.join(directory, f'shard{k}'), 1, shard = (k, 2))
+            shard0 = completed(os.path.join(directory, 'shard0'), graphs, distributions, mechanisms, 40)
+            shard1 = completed(os.path.join(directory, 'shard1'), graphs, distributions, mechanisms, 40)
+            self.assertFalse((shard0 & shard1).any())
+            self.assertTrue(((shard0 | shard1).sum(axis=3) >= 6).all())
+            ResultSet([os.path.join(directory, 'shard0'), os.path.join(directory, 'shard1')]).merge(
+                os.path.join(directory, 'merged'))
+
+    def test_shards(self):
+        from graphgen.gnp import GNP, GNPSweep
+        from graphgen.Schweimer22 import Schweimer22
+        from mechanism.NSP import NSP
+        from mechanism.SCM import SCM
+        def experiment():
+            sweep = GNPSweep()
+            graphs = {'GNP 0.1': (GNP(0.1, sweep = sweep), 30), 'GNP 0.2': (GNP(0.2, sweep = sweep), 30),
+                'Schweimer22': (Schweimer22(), 40)}
+            return graphs, {'uniform': stats.uniform()}, {'NSP': NSP(), 'SCM': SCM()}
+        with tempfile.TemporaryDirectory() as directory:
+            path = lambda name: os.path.join(directory, name)
+            runExperiment(TrialSource(4, 2), *experiment(), 5, path('all'), 1)
+            # three shards in separate runs (and processes), merged in any order
+            for k in (2, 0, 1):
+                runExperiment(TrialSource(4, 2), *experiment(), 5, path(f'shard{k}'), 2, shard = (k, 3))
+            ResultSet([path('all')]).merge(path('merged'))
+            ResultSet([path('shard1'), path('shard2'), path('shard0')]).merge(path('shards'))
+            for name in RECORD.names[:-1]:
+                with open(os.path.join(path('merged'), name + '.bin'), 'rb') as f, \
+                        open(os.path.join(path('shards'), name + '.bin'), 'rb') as g:
+                    self.assertEqual(f.read(), g.read(), name)
+            self.assertEqual(len(ResultShard(path('shards'))), 30)
+
+if __name__ == "__main__":
+    unittest.main()
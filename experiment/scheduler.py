@@ -0,0 +1,133 @@
+import math
+import numpy as np
+import unittest
+from typing import Dict, List, Tuple
+
+# A work unit is a batch of trials of one graph configuration:
+# (gname, first trial, number of trials).
+Unit = Tuple[str, int, int]
+# A task runs a unit for some of the distributions and mechanisms (by name),
+# those of the cells the unit has not finished yet.
+Task = Tuple[Unit, Tuple[str, ...], Tuple[str, ...]]
+
+class CostModel:
+    # Estimated seconds of a task: per trial, the generation of its graph
+    # plus, for every mechanism, its time on one bid profile times the
+    # number of distributions. A (configuration, mechanism) that has run
+    # uses its measured mean; otherwise the time is the size of the
+    # configuration (its nodes, and nodes plus edges once a graph of it has
+    # been generated) times a rate per mechanism (or generation) fitted on
+    # everything measured so far. Before any measurement the rates are 1,
+    # which still orders tasks by size.
+    GENERATE = None
+
+    def __init__(self, sizes: Dict[str, float]):
+        self.sizes = dict(sizes)
+        # (gname, mname) -> [seconds, profiles or trials]
+        self.measured: Dict[Tuple[str, str], List[float]] = {}
+        # mname -> [seconds, size * profiles or trials]
+        self.rates: Dict[str, List[float]] = {}
+
+    def rate(self, mname: str) -> float:
+        seconds, work = self.rates.get(mname, (0, 0))
+        if work > 0:
+            return seconds / work
+        known = [s / w for s, w in self.rates.values() if w > 0]
+        return float(np.mean(known)) if known else 1.0
+
+    def perProfile(self, gname: str, mname: str) -> float:
+        seconds, count = self.measured.get((gname, mname), (0, 0))
+        if count > 0:
+            return seconds / count
+        return self.sizes[gname] * self.rate(mname)
+
+    def estimate(self, task: Task) -> float:
+        (gname, _, count), dnames, mnames = task
+        return count * (self.perProfile(gname, self.GENERATE)
+            + len(dnames) * sum(self.perProfile(gname, mname) for mname in mnames))
+
+    def observe(self, gname: str, mname: str, seconds: float, count: int):
+        # count profiles (or, for the generation, trials) took seconds in all
+        entry = self.measured.setdefault((gname, mname), [0.0, 0])
+        entry[0] += seconds
+        entry[1] += count
+        rate = self.rates.setdefault(mname, [0.0, 0.0])
+        rate[0] += seconds
+        rate[1] += self.sizes[gname] * count
+
+    def observeSize(self, gname: str, size: float):
+        # the mean nodes plus edges of the graphs a task has generated
+        self.sizes[gname] = size
+
+class Scheduler:
+    # Longest-processing-time-first dispatch of tasks to a pool: the next task
+    # is always the one with the largest current estimate, and a task whose
+    # estimate exceeds a fair share (the remaining work over splitFactor times
+    # the processes) is first split into batches of consecutive trials, so no
+    # single task holds up the end of the run, though never into batches of
+    # fewer than minBatch trials. Estimates are refined with every finished task.
+    def __init__(self, tasks: List[Task], model: CostModel, processes: int, splitFactor: int = 3,
+            minBatch: int = 1):
+        self.pending = list(tasks)
+        self.model = model
+        self.processes = processes
+        self.splitFactor = splitFactor
+        self.minBatch = minBatch
+
+    def __len__(self):
+        return len(self.pending)
+
+    def next(self) -> Task:
+        costs = [self.model.estimate(task) for task in self.pending]
+        k = int(np.argmax(costs))
+        task = self.pending.pop(k)
+        (gname, start, count), dnames, mnames = task
+        share = sum(costs) / (self.splitFactor * self.processes)
+        if self.processes > 1 and count >= 2 * self.minBatch and costs[k] > share:
+            size = max(self.minBatch, math.ceil(count / math.ceil(costs[k] / share)))
+            self.pending.extend(((gname, s, min(size, start + count - s)), dnames, mnames)
+                for s in range(start + size, start + count, size))
+            task = ((gname, start, size), dnames, mnames)
+        return task
+
+    def finished(self, task: Task, records: np.ndarray, elapsed: float, size: float, mechanisms: List[str]):
+        # records of the task (coded by the experiment's mechanisms), its wall
+        # time and graph size; what the mechanisms did not take is the generation
+        (gname, _, count), dnames, mnames = task
+        self.model.observeSize(gname, size)
+        total = 0.0
+        for m, mname in enumerate(mechanisms):
+            if mname in mnames:
+                seconds = float(records['seconds'][records['mechanism'] == m].sum())
+                self.model.observe(gname, mname, seconds, count * len(dnames))
+                total += seconds
+        self.model.observe(gname, CostModel.GENERATE, max(elapsed - total, 0.0), count)
+
+class TestScheduler(unittest.TestCase):
+    def test_lpt(self):
+        model = CostModel({'small': 10, 'large': 1000})
+        tasks = [(('small', s, 10), ('u',), ('NSP', 'SCM')) for s in range(0, 40, 10)] \
+            + [(('large', 0, 10), ('u',), ('NSP', 'SCM'))]
+        scheduler = Scheduler(tasks, model, processes = 4)
+        # the large unit goes first and is split into batches of a fair share
+        first = scheduler.next()
+        self.assertEqual(first[0][:2], ('large', 0))
+        self.assertLess(first[0][2], 10)
+        self.assertEqual(sum(task[0][2] for task in scheduler.pending if task[0][0] == 'large'), 10 - first[0][2])
+        # SCM turns out 100 times slower than NSP, which reorders nothing
+        # here but is carried over to configurations not measured yet
+        records = np.zeros(2 * first[0][2], dtype=[('mechanism', '<i4'), ('seconds', '<f8')])
+        records['mechanism'][1::2] = 1
+        records['seconds'] = np.where(records['mechanism'] == 1, 1.0, 0.01)
+        scheduler.finished(first, records, elapsed = 1.01 * first[0][2] + 0.5, size = 1000, mechanisms = ['NSP', 'SCM'])
+        self.assertAlmostEqual(model.perProfile('large', 'SCM'), 1.0)
+        self.assertAlmostEqual(model.perProfile('small', 'SCM') / model.perProfile('small', 'NSP'), 100)
+        # every trial is dispatched exactly once
+        trials = [(first[0][0], t) for t in range(first[0][1], first[0][1] + first[0][2])]
+        while len(scheduler):
+            (gname, start, count), _, _ = scheduler.next()
+            trials.extend((gname, t) for t in range(start, start + count))
+        self.assertEqual(sorted(trials), sorted([('small', t) for t in range(40)] + [('large', t) for t in range(10)]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,23 @@
+import numpy as np
+import zlib
+
+# Every random draw of an experiment comes from a generator made from a seed
+# sequence below the root seed of the sweep, named by the component, the
+# configuration where it matters, and the trial:
+#   (seed, 'graph', trial)                          the graph of a trial
+#   (seed, 'seller', trial)                         its seller
+#   (seed, 'bids', distribution, trial)             its bids
+#   (seed, 'mechanism', config, trial, mechanism)   a mechanism's own draws
+# Graphs, sellers and bids do not depend on the configuration, so all of
+# them see common random numbers (and the GNP of a sweep are nested), and any
+# trial can be run anywhere, alone, with the same outcome.
+
+def keyOf(name) -> int:
+    # names in a seed path are hashed to stable 32-bit integers
+    if isinstance(name, (int, np.integer)):
+        return int(name)
+    return zlib.crc32(str(name).encode('utf-8'))
+
+def seedSequence(seed: int, *path) -> np.random.SeedSequence:
+    # the seed at path (names or integers) below the root seed
+    return np.random.SeedSequence(seed, spawn_key = tuple(keyOf(x) for x in path))
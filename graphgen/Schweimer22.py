@@ -9,15 +9,227 @@
 #   https://doi.org/10.1145/3485447.3512194
 
 import numpy as np
-import pandas as pd
 import networkx as nx
 import random
+import math
+import unittest
+from itertools import combinations, filterfalse, islice
 from scipy.stats import chi2
 from scipy.stats import norm
-from itertools import combinations
 
 from .genBase import GraphGen
 
+def skipSample(u, weights, start, a, b, rand, found):
+    # Miller and Hagberg (2011): candidates weights[start:] are sorted in
+    # decreasing order, so min(1, a*u*w + b) is non-increasing along them.
+    # Jump ahead geometrically with the current probability p and accept the
+    # landing candidate with q/p; each pair keeps its own probability q, and
+    # the time is proportional to the number of sampled edges.
+    n = len(weights)
+    k = start
+    if k >= n:
+        return
+    p = min(a*u*weights[k] + b, 1)
+    while p > 0:
+        if p < 1:
+            k += int(math.log(1.0 - rand())/math.log(1.0 - p))
+        if k >= n:
+            return
+        q = min(a*u*weights[k] + b, 1)
+        if rand() < q/p:
+            found.append(k)
+        p = q
+        k += 1
+        if k >= n:
+            return
+
+def sampleUndirectedPairs(w: np.ndarray, a: float, b: float, rand):
+    # pairs {i, j}, i != j, each independently with probability min(1, a*w[i]*w[j] + b)
+    order = np.argsort(-w, kind='stable')
+    weights = w[order].tolist()
+    U, V = [], []
+    for i in range(len(weights) - 1):
+        found = []
+        skipSample(weights[i], weights, i + 1, a, b, rand, found)
+        U.extend([i]*len(found))
+        V.extend(found)
+    return order[np.array(U, dtype=np.int64)], order[np.array(V, dtype=np.int64)]
+
+def sampleDirectedPairs(wOut: np.ndarray, wIn: np.ndarray, a: float, b: float, rand):
+    # edges u -> v, u != v, wOut[u] > 0 and wIn[v] > 0, each independently with
+    # probability min(1, a*wOut[u]*wIn[v] + b)
+    sources = np.flatnonzero(wOut > 0)
+    sources = sources[np.argsort(-wOut[sources], kind='stable')]
+    weights = wOut[sources].tolist()
+    src = sources.tolist()
+    U, V = [], []
+    for v in np.flatnonzero(wIn > 0).tolist():
+        found = []
+        skipSample(wIn[v], weights, 0, a, b, rand, found)
+        for k in found:
+            if src[k] != v:
+                U.append(src[k])
+                V.append(v)
+    return np.array(U, dtype=np.int64), np.array(V, dtype=np.int64)
+
+def unrankPairs(d: int, t: np.ndarray):
+    # positions (i, j), i < j, of the t-th pairs of combinations(range(d), 2)
+    t = np.asarray(t, dtype=np.int64)
+    i = (d - 2 - np.floor((np.sqrt(4*d*(d-1) - 8*t - 7) - 1)/2)).astype(np.int64)
+    j = t + i + 1 - d*(d-1)//2 + (d-i)*(d-i-1)//2
+    return i, j
+
+# the neighbor kinds of a node v: u with u <-> v, u -> v only, v -> u only
+MUTUAL, IN_ONLY, OUT_ONLY = 0, 1, 2
+# the kind of v as a neighbor of u, by the kind of u as a neighbor of v
+MIRROR = (MUTUAL, OUT_ONLY, IN_ONLY)
+
+class TriangleRewiring:
+    # The triangle-closing rewiring of Schweimer et al. on per-node adjacency
+    # sets, so that edge tests are set lookups and swaps are applied in place.
+    # Nodes are the integers 0..n-1 and are rewired in increasing order.
+    def __init__(self, n: int, src: np.ndarray, dst: np.ndarray, rand: random.Random):
+        # nbr[v] = succ[v] | pred[v]; active[v] maps the neighbors still bigger
+        # than every node rewired so far (done), the only ones that can be
+        # second degree neighbors from now on, to their kind, and kinds[v][kind]
+        # holds those of each kind as the keys of a dict, which keeps them in a
+        # reproducible order
+        self.succ = [set() for _ in range(n)]
+        self.nbr = [set() for _ in range(n)]
+        for u, v in zip(src.tolist(), dst.tolist()):
+            self.succ[u].add(v)
+            self.nbr[u].add(v)
+            self.nbr[v].add(u)
+        self.active = [{} for _ in range(n)]
+        self.kinds = [({}, {}, {}) for _ in range(n)]
+        for v in range(n):
+            for u in sorted(self.nbr[v]):
+                kind = self.active[v][u] = self.kind(v, u)
+                self.kinds[v][kind][u] = None
+        self.done = -1
+        self.rand = rand
+
+    def kind(self, u: int, v: int) -> int:
+        # the kind of a neighbor v of u
+        if v not in self.succ[u]:
+            return IN_ONLY
+        return MUTUAL if u in self.succ[v] else OUT_ONLY
+
+    def retire(self, node: int):
+        # nodes up to node are no candidates anymore
+        for w in range(self.done + 1, node + 1):
+            for u in self.nbr[w]:
+                del self.kinds[u][self.active[u].pop(w)][w]
+        self.done = max(self.done, node)
+
+    def unlink(self, u: int, v: int, kind: int):
+        # remove every edge between u and a neighbor v of the given kind
+        if v > self.done:
+            del self.active[u][v], self.kinds[u][kind][v]
+        if u > self.done:
+            del self.active[v][u], self.kinds[v][MIRROR[kind]][u]
+        self.nbr[u].discard(v)
+        self.nbr[v].discard(u)
+        self.succ[u].discard(v)
+        self.succ[v].discard(u)
+
+    def link(self, u: int, v: int, kind: int):
+        # connect the unconnected u and v so that v is a neighbor of u of the given kind
+        if v > self.done:
+            self.active[u][v] = kind
+            self.kinds[u][kind][v] = None
+        if u > self.done:
+            self.active[v][u] = MIRROR[kind]
+            self.kinds[v][MIRROR[kind]][u] = None
+        self.nbr[u].add(v)
+        self.nbr[v].add(u)
+        if kind != IN_ONLY:
+            self.succ[u].add(v)
+        if kind != OUT_ONLY:
+            self.succ[v].add(u)
+
+    def rewireNode(self, node: int, MED: float):
+        # First degree neighbors of the node; a fraction of their pairs, depending
+        # on the degree, gets the chance to connect. The pairs are sampled by their
+        # rank in combinations(Ne1, 2) without listing the combinations.
+        self.retire(node)
+        Ne1 = list(self.nbr[node])
+        dir_degree = len(Ne1)
+        x = 0.5 if dir_degree <= MED else 0.3
+        k = int(np.ceil(dir_degree * (dir_degree-1) * x))
+        if k == 0:
+            return
+        I, J = unrankPairs(dir_degree, self.rand.sample(range(dir_degree*(dir_degree-1)//2), k))
+        rewirePair = self.rewirePair
+        for i, j in zip(I.tolist(), J.tolist()):
+            rewirePair(Ne1[i], Ne1[j])
+
+    def draw(self, Neighbor1: int, Neighbor2: int, kind: int, exclude: set, count1: int, count2: int):
+        # a uniform draw of the c1 and c2 of a swap: c1 from the count1
+        # neighbors of Neighbor1 of a kind left as candidates that are not in
+        # exclude, c2 from the count2 such neighbors of Neighbor2 of the
+        # mirrored kind
+        rand, skip = self.rand.random, exclude.__contains__
+        c1 = next(islice(filterfalse(skip, self.kinds[Neighbor1][kind]), int(rand() * count1), None))
+        c2 = next(islice(filterfalse(skip, self.kinds[Neighbor2][MIRROR[kind]]), int(rand() * count2), None))
+        return c1, c2
+
+    def rewirePair(self, Neighbor1: int, Neighbor2: int):
+        # Only potentially rewire if the two nodes are not connected (these already form a triangle)
+        if Neighbor2 in self.nbr[Neighbor1]:
+            return
+
+        # Give it 10 tries to find an edge for the rewiring: a try draws second
+        # degree neighbors c1 of Neighbor1 and c2 of Neighbor2 with a bigger
+        # number than the investigated node, each connected to only one of the
+        # two first degree neighbors, and rewires if c1 and c2 are not
+        # connected and their edges fit one of the three swaps below. The tries
+        # up to the first whose edges fit are geometric, so that one is drawn
+        # directly from the candidates of the fitting kinds; the candidates are
+        # the neighbors left but the common ones, and are only counted up to then.
+        active1, active2 = self.active[Neighbor1], self.active[Neighbor2]
+        common = active1.keys() & active2.keys()
+        total1, total2 = len(active1) - len(common), len(active2) - len(common)
+        if total1 == 0 or total2 == 0:
+            return
+        count1, count2 = list(map(len, self.kinds[Neighbor1])), list(map(len, self.kinds[Neighbor2]))
+        for u in common:
+            count1[active1[u]] -= 1
+            count2[active2[u]] -= 1
+        # a c1 of a kind for Neighbor1 goes with a c2 of the mirrored kind for
+        # Neighbor2: c1 - Neighbor1 and Neighbor2 - c2, c1 -> Neighbor1 and
+        # Neighbor2 -> c2, or c1 <- Neighbor1 and Neighbor2 <- c2
+        weights = (count1[MUTUAL] * count2[MUTUAL], count1[IN_ONLY] * count2[OUT_ONLY], count1[OUT_ONLY] * count2[IN_ONLY])
+        fitting = sum(weights)
+        if fitting == 0:
+            return
+        q = fitting / (total1 * total2)
+        logMiss = math.log(1.0 - q) if q < 1 else None
+        rand = self.rand.random
+        tries = 10
+        while True:
+            if logMiss is not None:
+                tries -= 1 + int(math.log(1.0 - rand()) / logMiss)
+            else:
+                tries -= 1
+            if tries < 0:
+                return
+            x = rand() * fitting
+            kind = MUTUAL if x < weights[0] else IN_ONLY if x < weights[0] + weights[1] else OUT_ONLY
+            c1, c2 = self.draw(Neighbor1, Neighbor2, kind, common, count1[kind], count2[MIRROR[kind]])
+
+            # There may not be a connection between them
+            if c2 in self.nbr[c1]:
+                continue
+
+            # Neighbor1 and Neighbor2 take over the edges of c1 - Neighbor1, and
+            # c1 and c2 those of Neighbor2 - c2
+            self.unlink(Neighbor1, c1, kind)
+            self.unlink(Neighbor2, c2, MIRROR[kind])
+            self.link(c1, c2, MIRROR[kind])
+            self.link(Neighbor1, Neighbor2, kind)
+            return
+
 class Schweimer22(GraphGen):
     def __init__(self,
         Rho_1: float = .8, Rho_2: float = .8, Rho_3: float = .8,
@@ -41,14 +253,15 @@ class Schweimer22(GraphGen):
         self.REWIRE = REWIRE
 
     
-    def __call__(self, n: int) -> nx.DiGraph:
+    def __call__(self, n: int, rng = None) -> nx.DiGraph:
+        rng = np.random.default_rng(rng)
         R_1 = 2*np.sin(self.Rho_1*np.pi/6)
         R_2 = 2*np.sin(self.Rho_2*np.pi/6)
         R_3 = 2*np.sin(self.Rho_3*np.pi/6)
         mean = [0,0,0]
         cov = [[1,R_1,R_2], [R_1,1,R_3], [R_2,R_3,1]] 
 
-        norm_1,norm_2,norm_3 = np.random.multivariate_normal(mean, cov, n).T
+        norm_1,norm_2,norm_3 = rng.multivariate_normal(mean, cov, n).T
 
         # Transform the data to be uniformly distributed
         unif_1 = norm.cdf(norm_1)
@@ -62,292 +275,184 @@ class Schweimer22(GraphGen):
         ONLY_OUT = chi2.ppf(unif_3, df=self.out_df, loc=self.out_loc, scale=self.out_scale)
         ONLY_OUT = np.round(ONLY_OUT)
 
-        SAMPLED = pd.DataFrame(columns=['Reciprocal', 'In', 'Out'])
-
-        SAMPLED['Reciprocal'] = RECIPROCAL
-        SAMPLED['In'] = ONLY_IN
-        SAMPLED['Out'] = ONLY_OUT
-
-        # Get the total degree per node
-        total = SAMPLED['Reciprocal'] + SAMPLED['In'] + SAMPLED['Out']
-        SAMPLED['Total'] = total
-
-        # Shuffle the dataframe
-        SAMPLED = SAMPLED.sample(frac=1)
+        # Shuffle the sampled degrees
+        shuffle = rng.permutation(n)
 
         # Number of nodes
-        numNodes = SAMPLED.shape[0]
+        numNodes = n
 
         # Node numbers
         Nodes = list(range(1, numNodes+1))
 
         # Reciprocal degrees
-        RECIPROCAL = list(SAMPLED['Reciprocal'])
+        RECIPROCAL = RECIPROCAL[shuffle]
 
         # Out degree without reciprocal edges
-        OUT = list(SAMPLED['Out'])
+        OUT = ONLY_OUT[shuffle]
 
         # In degree without reciprocal edges
-        IN = list(SAMPLED['In'])
+        IN = ONLY_IN[shuffle]
 
         # Number of nodes with a reciprocal degree bigger than 0 
-        reciprocal = [i for i in RECIPROCAL if i > 0]
-        reciprocal = len(reciprocal)
+        reciprocal = np.count_nonzero(RECIPROCAL > 0)
 
         # Number of nodes with an out degree bigger than 0 
-        out = [i for i in OUT if i > 0]
-        out = len(out)
+        out = np.count_nonzero(OUT > 0)
 
         # Number of nodes with an in degree bigger than 0 
-        r = [i for i in IN if i > 0]
-        r = len(r)
+        r = np.count_nonzero(IN > 0)
 
         # Number of reciprocal edges
-        Edges_m = sum(RECIPROCAL)*2
+        Edges_m = RECIPROCAL.sum()*2
 
         # Number of directed edges
-        Edges_d = (sum(OUT) + sum(IN))/2
-
-        diag_sum_m = 0
+        Edges_d = (OUT.sum() + IN.sum())/2
 
         # Probability of the diagonal elements
-        for i in range(numNodes):
-            if RECIPROCAL[i] != 0:
-                diag_sum_m += RECIPROCAL[i]**2/Edges_m
-                
+        diag_sum_m = np.sum(RECIPROCAL**2)/Edges_m
+
         # Distribute the sum uniformly over all other possible edges
         diag_sum_m_dist = diag_sum_m/(reciprocal*(reciprocal-1)/2)
 
-        diag_sum_d = 0
-        diag = 0
-
         # Probability of the diagonal elements
-        for i in range(numNodes):
-            if (IN[i] != 0 and OUT[i] != 0):
-                diag_sum_d += IN[i]*OUT[i]/Edges_d
-                diag +=1
-                
+        both = (IN != 0) & (OUT != 0)
+        diag_sum_d = np.sum(IN[both]*OUT[both])/Edges_d
+        diag = np.count_nonzero(both)
+
         # Distribute the sum uniformly over all other possible edges
         diag_sum_d_dist = diag_sum_d/(out*r-diag)
 
-        Connection_r = []
-
-        counter = 0
-        directed_sum = 0
-
-        for i in range(numNodes):      
-            for j in range(i+1, numNodes):
-                a = 0
-                
-                # Sampling of reciprocal edges
-                if (RECIPROCAL[j] != 0 and RECIPROCAL[i] != 0):
-                    pr = 2*RECIPROCAL[i]*RECIPROCAL[j]/Edges_m + diag_sum_m_dist
-                    if pr>1:
-                        pr=1
-                    a = np.random.choice(np.arange(0,2), p=[1-pr, pr])
-                    if a == 1:
-                        Connection_r.append((i+1,j+1))
-                        Connection_r.append((j+1,i+1))
-                        
-                        # This part is for the compensation for the sampled edges that we lose while trying to sample directed edges
-                        if(IN[i] != 0 and OUT[j] != 0):
-                            counter += 1
-                            directed_sum += IN[i]*OUT[j]/Edges_d + diag_sum_d_dist
-                            
-                        if(IN[j] != 0 and OUT[i] != 0):
-                            counter += 1
-                            directed_sum += OUT[i]*IN[j]/Edges_d + diag_sum_d_dist
-        
-        sampled_reciprocal = directed_sum/(out*r-diag-counter)
-
-        Connection_d = []
-
-        for i in range(numNodes):      
-            for j in range(i+1, numNodes):
-                # if a reciprocal edge is sampled a = 1, we do not get down here
-                    
-                # Sampling of directed edges (bigger number to smaller number)
-                if(IN[i] != 0 and OUT[j] != 0):
-                    pr_d = IN[i]*OUT[j]/Edges_d + diag_sum_d_dist + sampled_reciprocal
-                    if pr_d>1:
-                        pr_d=1
-                    b = np.random.choice(np.arange(0,2), p=[1-pr_d, pr_d])
-                    if b == 1:
-                        Connection_d.append((j+1,i+1))
-
-                # Sampling of directed edges (smaller number to bigger number)
-                if(IN[j] != 0 and OUT[i] != 0):
-                    pr_d = OUT[i]*IN[j]/Edges_d + diag_sum_d_dist + sampled_reciprocal
-                    if pr_d>1:
-                        pr_d=1
-                    c = np.random.choice(np.arange(0,2), p=[1-pr_d, pr_d])
-                    if c == 1:
-                        Connection_d.append((i+1,j+1))
-
-        # Directed empty graph
-        Graph = nx.DiGraph()
-
-        # Add the nodes
-        Graph.add_nodes_from(Nodes)
-
-        # Add the edges
-        Graph.add_edges_from(Connection_r)   
-        Graph.add_edges_from(Connection_d)   
+        # A Python RNG for the skip samplers and the rewiring, seeded from rng
+        py = random.Random(int(rng.integers(2**63)))
+        rand = py.random
 
-        # Translate the graph into a matrix
-        M = nx.to_numpy_matrix(Graph)
+        # Sampling of reciprocal edges: every pair i < j of nodes with a reciprocal
+        # degree bigger than 0 with probability 2*R[i]*R[j]/Edges_m + diag_sum_m_dist
+        positive = np.flatnonzero(RECIPROCAL > 0)
+        ri, rj = sampleUndirectedPairs(RECIPROCAL[positive], 2/Edges_m, diag_sum_m_dist, rand)
+        ri, rj = positive[ri], positive[rj]
+        Connection_r = list(zip((ri+1).tolist(), (rj+1).tolist())) + list(zip((rj+1).tolist(), (ri+1).tolist()))
 
-        # Multiply with the transpose to find reciprocal edges
-        Reciprocal = nx.from_numpy_matrix(np.multiply(M,(M.T)), create_using=nx.DiGraph())
+        # This part is for the compensation for the sampled edges that we lose while trying to sample directed edges
+        forward = (IN[ri] != 0) & (OUT[rj] != 0)
+        backward = (IN[rj] != 0) & (OUT[ri] != 0)
+        counter = int(forward.sum() + backward.sum())
+        directed_sum = np.sum(IN[ri[forward]]*OUT[rj[forward]]/Edges_d + diag_sum_d_dist) \
+            + np.sum(OUT[ri[backward]]*IN[rj[backward]]/Edges_d + diag_sum_d_dist)
 
-        # Re-numerate the nodes of the reciprocal graph
-        mapping = {i: Graph for i, Graph in enumerate(list(Graph.nodes()))}
-        Reciprocal = nx.relabel_nodes(Reciprocal, mapping)
-
-        # List of reciprocal edges
-        reciprocal_edges = list(Reciprocal.edges)
-
-        # Save the node information for the graph in a dataframe
-        degrees = pd.concat([pd.Series(dict(Graph.in_degree()), name='in'), 
-                            pd.Series(dict(Graph.out_degree()), name='out'),
-                            pd.Series(dict(Reciprocal.in_degree()), name='reciprocal'),
-                            pd.Series(pd.Series(dict(Graph.in_degree()))+pd.Series(dict(Graph.out_degree())), name='total')], 
-                            axis=1)
+        sampled_reciprocal = directed_sum/(out*r-diag-counter)
 
-        degrees['Ne'] = degrees['total'] - degrees['reciprocal']
+        # Sampling of directed edges: every ordered pair u != v with OUT[u] and IN[v]
+        # bigger than 0 with probability OUT[u]*IN[v]/Edges_d + diag_sum_d_dist + sampled_reciprocal
+        du, dv = sampleDirectedPairs(OUT, IN, 1/Edges_d, diag_sum_d_dist + sampled_reciprocal, rand)
+        Connection_d = list(zip((du+1).tolist(), (dv+1).tolist()))
+
+        # Distinct edges as sorted keys src*numNodes + dst over 0-based nodes; an
+        # edge is reciprocal if its reverse key is present as well
+        src = np.concatenate((ri, rj, du))
+        dst = np.concatenate((rj, ri, dv))
+        key = np.unique(src*numNodes + dst)
+        src, dst = key // numNodes, key % numNodes
+        mutual = np.isin(dst*numNodes + src, key, assume_unique=True)
+
+        # In, out and reciprocal degree per node; Ne counts distinct neighbors
+        inDegree = np.bincount(dst, minlength=numNodes)
+        outDegree = np.bincount(src, minlength=numNodes)
+        reciprocalDegree = np.bincount(dst[mutual], minlength=numNodes)
+        Ne = inDegree + outDegree - reciprocalDegree
 
         # Nodes with 0 or 1 neighbors are not considered for the rewiring procedure
-        SORT = sorted(list(degrees['Ne']))
-
         if self.REWIRE == 0:
             DEG = 0
         else:
-            if (int(np.round(numNodes*self.REWIRE)) == numNodes):
-                DEG = SORT[int(np.round(numNodes*self.REWIRE))-1]
-            else:
-                DEG = SORT[int(np.round(numNodes*self.REWIRE))-1]
+            DEG = np.sort(Ne)[int(np.round(numNodes*self.REWIRE))-1]
 
         # Nodes with a small reciprocal degree
-        nodes = list(degrees[(degrees['Ne'] > 1) & (degrees['Ne'] <= DEG)].index)
+        small = (Ne > 1) & (Ne <= DEG)
+        nodes = (np.flatnonzero(small)+1).tolist()
 
-        MED = degrees[(degrees['Ne'] > 1) & (degrees['Ne'] <= DEG)]['Ne'].median()
+        MED = np.median(Ne[small]) if nodes else 0
 
-        for i in range(len(nodes)):
-            help = 0
+        # Close triangles around the selected nodes, in place on adjacency sets
+        engine = TriangleRewiring(numNodes+1, src+1, dst+1, py)
+        for node in nodes:
+            engine.rewireNode(node, MED)
 
-            # First degree neighbors of the node we are investigating
-            # As it is a directed graph, we need the neighbors and concatenate the predecessors
-            Ne1 = list(set(list(Graph.predecessors(nodes[i])) + list(Graph.neighbors(nodes[i]))))
+        # Directed graph on the node numbers with the rewired edges
+        Graph = nx.DiGraph()
+        Graph.add_nodes_from(Nodes)
+        Graph.add_edges_from((u, v) for u in Nodes for v in engine.succ[u])
 
-            # Second degree neighbors of the nodes we are investigating
-            Ne2 = []
-            dir_degree = len(Ne1)
-            if dir_degree <= MED:
-                x = 0.5
-            else:
-                x = 0.3
-                
-            # Get all the first degree neighbor pairs
-            output = sum([list(map(list, combinations(Ne1, 2)))], [])
-            Neighbors = random.sample(output, int(np.ceil(dir_degree * (dir_degree-1) * x)))
-            
-            # We give a fraction of the first degree neighbor pairs the chance to connect, depending on the node degree
-            for j in range(int(np.ceil(dir_degree * (dir_degree-1) * x))):
-                
-                help = 0
-            
-                # Randomly sample the first degree neighbors that we want to check for rewiring
-                # Note that the same pair can be sampled again
-                Neighbor1 = Neighbors[j][0]
-                Neighbor2 = Neighbors[j][1]
-
-                # Candidates for rewiring (2nd degree neighbors)
-                Candidates = []
-
-                # Rewiring only possible if the list of candidates is not empty
-                Candidates_final = []
-
-                # Final edge to rewire
-                rewire = 0
-
-                # Only potentially rewire if the two nodes are not connected (these already form a triangle)
-                if ((Neighbor1, Neighbor2) in Graph.edges or (Neighbor2, Neighbor1) in Graph.edges) == False:
-                    # Second degree neighbors: Here we could have multipe entries for one node as we can have a reciprocal edge
-                    # Therefore we eliminate duplicate entries by making the list a set and then a list again
-                    Ne2 = []
-                    Ne2.append(list(set(list(Graph.predecessors(Neighbor1)) + list(Graph.neighbors(Neighbor1)))))
-                    Ne2.append(list(set(list(Graph.predecessors(Neighbor2)) + list(Graph.neighbors(Neighbor2)))))
-                        
-                    # Remove all 2nd degree neighbors with a smaller number than the currently investigated node
-                    # This is to not interrupt the already created triangles too much
-                    Ne2[0] = [x for x in Ne2[0] if x > nodes[i]]
-                    Ne2[1] = [x for x in Ne2[1] if x > nodes[i]]
-
-                    # Find the nodes in Ne2 that are connected to both nodes of Ne1 and remove them
-                    non_unique = []
-                    intersect = set(Ne2[0]).intersection(set(Ne2[1]))
-                    for m in range(len(intersect)):
-                        non_unique.append(list(intersect)[m])
-
-                    # Remove the non-unique nodes from the list of neighbors (includes the node we are originally investigating)
-                    for m in range(len(non_unique)):
-                        Ne2[0].remove(non_unique[m])
-                        Ne2[1].remove(non_unique[m])
-
-                    # Lists may not be empty
-                    if (Ne2[0] and Ne2[1]):
-
-                        # Give it 10 tries to find an edge for the rewiring (here we do not loop throigh all, but randomy choose two nodes from both lists of 2nd degree neighbors)
-                        for l in range(10):
-                            
-                            # With the variable 'help', we check if we have found a match for rewiring
-                            if help == 0:
-                                
-                                rewire = 0
-
-                                # Randomly choose a node from Ne2[0] and from Ne2[1]
-                                Candidate1 = random.choice(Ne2[0])
-                                Candidate2 = random.choice(Ne2[1])
-
-                                # Save the candidate edges in a list
-                                Candidates = [(Candidate1, Candidate2), (Candidate2, Candidate1)]
-
-                                # There may not be a connection between them
-                                if (Candidates[0] not in Graph.edges and Candidates[1] not in Graph.edges):
-                                    rewire = Candidates[0]
-
-                                    # In the variable "rewire", we save the edges that can be established
-                                    if rewire != 0:
-
-                                        # rewire[0] - Neighbor1 and Neighbor2 - rewire[1]
-                                        if ((rewire[0], Neighbor1) in Graph.edges and (Neighbor1, rewire[0]) in Graph.edges and (rewire[1], Neighbor2) in Graph.edges and (Neighbor2, rewire[1]) in Graph.edges):
-                                            Graph.remove_edge(rewire[0], Neighbor1)
-                                            Graph.remove_edge(Neighbor1, rewire[0])
-                                            Graph.remove_edge(rewire[1], Neighbor2)
-                                            Graph.remove_edge(Neighbor2, rewire[1])
-
-                                            Graph.add_edge(rewire[0], rewire[1])
-                                            Graph.add_edge(rewire[1], rewire[0])
-                                            Graph.add_edge(Neighbor1, Neighbor2)
-                                            Graph.add_edge(Neighbor2, Neighbor1)
-                                            help = 1
-
-                                        # rewire[0] -> Neighbor1 and Neighbor2 -> rewire[1]
-                                        if ((rewire[0], Neighbor1) in Graph.edges and (Neighbor1, rewire[0]) not in Graph.edges and (rewire[1], Neighbor2) not in Graph.edges and (Neighbor2, rewire[1]) in Graph.edges):
-                                            Graph.remove_edge(rewire[0], Neighbor1)
-                                            Graph.remove_edge(Neighbor2, rewire[1])
-
-                                            Graph.add_edge(rewire[0], rewire[1])
-                                            Graph.add_edge(Neighbor2, Neighbor1)
-                                            help = 1
-
-                                        # rewire[0] <- Neighbor1 and Neighbor2 <- rewire[1]    
-                                        if ((rewire[0], Neighbor1) not in Graph.edges and (Neighbor1, rewire[0]) in Graph.edges and (rewire[1], Neighbor2) in Graph.edges and (Neighbor2, rewire[1]) not in Graph.edges):
-                                            Graph.remove_edge(Neighbor1, rewire[0])
-                                            Graph.remove_edge(rewire[1], Neighbor2)
-
-                                            Graph.add_edge(rewire[1], rewire[0])
-                                            Graph.add_edge(Neighbor1, Neighbor2)
-                                            help = 1
-        
         return Graph
+
+class TestSchweimer22(unittest.TestCase):
+    def test_unrank(self):
+        # ranks 0..d(d-1)/2-1 map onto combinations(range(d), 2), in order
+        for d in range(2, 15):
+            I, J = unrankPairs(d, np.arange(d*(d-1)//2))
+            self.assertEqual(list(zip(I.tolist(), J.tolist())), list(combinations(range(d), 2)))
+
+    def test_density(self):
+        # pairs are kept with probability min(1, a*w[i]*w[j] + b): the number
+        # sampled is within 4 standard deviations of its expectation
+        rng = np.random.default_rng(0)
+        rand = random.Random(0).random
+        n, a, b, trials = 60, 0.02, 0.05, 40
+        w, wOut, wIn = rng.uniform(0, 5, n), rng.integers(0, 4, n).astype(float), rng.integers(0, 4, n).astype(float)
+        P = np.minimum(a*np.outer(w, w) + b, 1)[np.triu_indices(n, 1)]
+        Q = np.minimum(a*np.outer(wOut, wIn) + b, 1) * np.outer(wOut > 0, wIn > 0)
+        np.fill_diagonal(Q, 0)
+        undirected = [sampleUndirectedPairs(w, a, b, rand) for _ in range(trials)]
+        directed = [sampleDirectedPairs(wOut, wIn, a, b, rand) for _ in range(trials)]
+        for pairs, p in ((undirected, P.ravel()), (directed, Q.ravel())):
+            counts = [len(U) for U, _ in pairs]
+            self.assertLess(abs(np.mean(counts) - p.sum()), 4*np.sqrt((p*(1 - p)).sum()/trials))
+        for U, V in undirected:
+            self.assertTrue(np.all(U != V))
+            self.assertEqual(len(set(zip(np.minimum(U, V).tolist(), np.maximum(U, V).tolist()))), len(U))
+        for U, V in directed:
+            self.assertTrue(np.all(U != V) and np.all(wOut[U] > 0) and np.all(wIn[V] > 0))
+            self.assertEqual(len(set(zip(U.tolist(), V.tolist()))), len(U))
+
+    def degrees(self, succ):
+        # (in, out, reciprocal) degree of every node
+        degrees = [[0, len(s), 0] for s in succ]
+        for u, s in enumerate(succ):
+            for v in s:
+                degrees[v][0] += 1
+                degrees[u][2] += u in succ[v]
+        return degrees
+
+    def test_rewiring(self):
+        rng = np.random.default_rng(1)
+        n = 80
+        U, V = rng.integers(0, n, 600), rng.integers(0, n, 600)
+        keep = U != V
+        # a third of the edges gets its reverse edge as well
+        both = keep & (rng.random(600) < 1/3)
+        src, dst = np.concatenate((U[keep], V[both])), np.concatenate((V[keep], U[both]))
+        engine = TriangleRewiring(n, src, dst, random.Random(1))
+        graph = lambda: nx.Graph([(u, v) for u in range(n) for v in engine.nbr[u]])
+        before, triangles = self.degrees(engine.succ), sum(nx.triangles(graph()).values())
+        counts = lambda degrees: (sum(d[2] for d in degrees), sum(d[1] - d[2] for d in degrees))
+        for node in range(n):
+            engine.rewireNode(node, 10)
+            if node == n // 2:
+                # the candidates left are the neighbors above the node, by kind
+                for u in range(n):
+                    self.assertEqual(engine.active[u], {v: engine.kind(u, v) for v in engine.nbr[u] if v > node})
+                    for kind, members in enumerate(engine.kinds[u]):
+                        self.assertEqual(set(members), {v for v, k in engine.active[u].items() if k == kind})
+        # degrees, and so the reciprocal and one-way edge counts, are kept
+        after = self.degrees(engine.succ)
+        self.assertEqual(after, before)
+        self.assertEqual(counts(after), counts(before))
+        self.assertGreater(counts(before)[0], 0)
+        self.assertGreater(counts(before)[1], 0)
+        self.assertGreater(sum(nx.triangles(graph()).values()), triangles)
+        for u in range(n):
+            self.assertNotIn(u, engine.succ[u])
+            self.assertEqual(engine.nbr[u], engine.succ[u] | {v for v in range(n) if u in engine.succ[v]})
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
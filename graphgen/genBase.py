@@ -1,7 +1,28 @@
 import networkx as nx
+import numpy as np
+from typing import List
 from abc import ABC, abstractmethod
+from mechanism.auctionGraph import AuctionGraph
 
 class GraphGen(ABC):
+    # Every graph is drawn from the np.random.Generator rng passed in, so a
+    # graph is reproducible from its seed alone wherever it is generated;
+    # rng may also be anything np.random.default_rng accepts (None for fresh
+    # entropy).
+
+    # True if every call returns the same graph, e.g. a graph read from a file
+    deterministic = False
+
     @abstractmethod
-    def __call__(self, n: int) -> nx.DiGraph:
-        pass
\ No newline at end of file
+    def __call__(self, n: int, rng = None) -> nx.DiGraph:
+        pass
+
+    def getAuctionGraph(self, n: int, rng = None) -> AuctionGraph:
+        # the same random graph as __call__ in the compact CSR form;
+        # generators that can build the arrays directly override this
+        return AuctionGraph.fromNetworkx(self(n, rng), bid = None)
+
+    def getAuctionGraphs(self, n: int, rngs: List[np.random.Generator]) -> List[AuctionGraph]:
+        # one graph per generator, e.g. for all the trials of a block;
+        # generators that can sample a whole batch at once override this
+        return [self.getAuctionGraph(n, rng) for rng in rngs]
\ No newline at end of file
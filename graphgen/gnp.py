@@ -1,9 +1,159 @@
 import networkx as nx
+import numpy as np
+import math
+import unittest
+from collections import OrderedDict
+from typing import List
 from .genBase import GraphGen
+from mechanism.auctionGraph import AuctionGraph
+
+def samplePairs(M: int, p: float, rng: np.random.Generator) -> np.ndarray:
+    # the positions among M pairs of a Bernoulli(p) trial per pair, drawn as
+    # cumulative geometric skips
+    if p <= 0 or M == 0:
+        return np.zeros(0, dtype=np.int64)
+    if p >= 1:
+        return np.arange(M, dtype=np.int64)
+    chunks = []
+    last = -1
+    while last < M - 1:
+        expected = (M - 1 - last) * p
+        pos = last + np.cumsum(rng.geometric(p, int(expected + 5 * math.sqrt(expected) + 16)))
+        chunks.append(pos[pos < M])
+        last = pos[-1]
+    return np.concatenate(chunks)
+
+def sampleGNP(n: int, p: float, rngs: List[np.random.Generator]):
+    # the edges of len(rngs) directed G(n, p) graphs without self-loops, the
+    # k-th drawn from rngs[k] alone: the n*(n-1) ordered pairs of every graph
+    # are laid end to end and the positions of its edges drawn as geometric
+    # skips. Returns (graph, source, target) arrays sorted by graph and source.
+    N = n * (n - 1)
+    positions = [samplePairs(N, p, rng) for rng in rngs]
+    pos = np.concatenate(positions) if positions else np.zeros(0, dtype=np.int64)
+    graph = np.repeat(np.arange(len(rngs)), [len(x) for x in positions])
+    u, w = np.divmod(pos, max(n - 1, 1))
+    return graph, u, w + (w >= u)
+
+def seedKey(rng: np.random.Generator):
+    # the seed a generator was made from, None if it is not known
+    seq = getattr(rng.bit_generator, 'seed_seq', None)
+    if not isinstance(seq, np.random.SeedSequence):
+        return None
+    return (seq.entropy, seq.spawn_key, seq.pool_size)
+
+class GNPSweep:
+    # Coupled G(n, p) graphs for a sweep over p from common random numbers:
+    # a trial draws one uniform per ordered pair from its generator, and every
+    # GNP in the sweep keeps the pairs whose uniform is below its p. Given
+    # generators made from the same seed, the graphs of one trial are nested
+    # in p wherever they are generated; the uniforms of a seed are kept until
+    # every GNP of the sweep has used them (or maxsize other seeds came later).
+    def __init__(self, maxsize: int = 64):
+        self.slots = 0
+        self.maxsize = maxsize
+        self.uniforms = OrderedDict()
+
+    def register(self) -> int:
+        self.slots += 1
+        return self.slots - 1
+
+    def getUniforms(self, n: int, rng: np.random.Generator) -> np.ndarray:
+        key = seedKey(rng)
+        entry = self.uniforms.get(key) if key is not None else None
+        if entry is None:
+            U = rng.random((n, n))
+            np.fill_diagonal(U, np.inf)
+            entry = [U, 0]
+            if key is not None:
+                self.uniforms[key] = entry
+                while len(self.uniforms) > self.maxsize:
+                    self.uniforms.popitem(last = False)
+        elif len(entry[0]) != n:
+            raise ValueError(f'GNPSweep trial has {len(entry[0])} nodes, not {n}')
+        entry[1] += 1
+        if entry[1] >= self.slots and key is not None:
+            del self.uniforms[key]
+        return entry[0]
+
+    def getAuctionGraph(self, p: float, n: int, rng: np.random.Generator) -> AuctionGraph:
+        src, dst = np.nonzero(self.getUniforms(n, rng) < p)
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(np.bincount(src, minlength=n))
+        return AuctionGraph(indptr, dst)
 
 class GNP(GraphGen):
-    def __init__(self, p: float):
+    def __init__(self, p: float, sweep: GNPSweep = None):
+        if not 0 <= p <= 1:
+            raise ValueError(f'GNP edge probability {p} is not in [0, 1]')
         self.p = p
+        self.sweep = sweep
+        if sweep is not None:
+            sweep.register()
+
+    def __call__(self, n: int, rng = None) -> nx.DiGraph:
+        return self.getAuctionGraph(n, rng).toNetworkx(bid = None)
+
+    def getAuctionGraph(self, n: int, rng = None) -> AuctionGraph:
+        rng = np.random.default_rng(rng)
+        if self.sweep is not None:
+            return self.sweep.getAuctionGraph(self.p, n, rng)
+        return self.getAuctionGraphs(n, [rng])[0]
+
+    def getAuctionGraphs(self, n: int, rngs: List[np.random.Generator]) -> List[AuctionGraph]:
+        # the graphs of a block from one pass over all their edges; each graph
+        # is the same as getAuctionGraph(n, rng) of its generator
+        if self.sweep is not None:
+            return super().getAuctionGraphs(n, rngs)
+        count = len(rngs)
+        graph, src, dst = sampleGNP(n, self.p, rngs)
+        bounds = np.searchsorted(graph, np.arange(count + 1))
+        indptr = np.zeros((count, n + 1), dtype=np.int64)
+        indptr[:, 1:] = np.cumsum(np.bincount(graph * n + src, minlength=count * n).reshape(count, n), axis=1)
+        return [AuctionGraph(indptr[k], dst[bounds[k]:bounds[k + 1]]) for k in range(count)]
+
+class TestGNP(unittest.TestCase):
+    def edges(self, graph):
+        src, dst = graph.edges()
+        return set(zip(src.tolist(), dst.tolist()))
+
+    def test_sweep(self):
+        sweep = GNPSweep()
+        low, high, plain = GNP(0.2, sweep = sweep), GNP(0.5, sweep = sweep), GNP(0.2)
+        n, trials = 30, 200
+        counts = {0.2: [], 0.5: [], 'plain': []}
+        for t in range(trials):
+            # graphs of the same seed are nested in p, whichever comes first
+            first, second = (high, low) if t % 2 else (low, high)
+            a = first.getAuctionGraph(n, np.random.default_rng(t))
+            b = second.getAuctionGraph(n, np.random.default_rng(t))
+            small, large = (b, a) if t % 2 else (a, b)
+            self.assertTrue(self.edges(small) <= self.edges(large))
+            counts[0.2].append(small.number_of_edges())
+            counts[0.5].append(large.number_of_edges())
+            counts['plain'].append(plain.getAuctionGraph(n, np.random.default_rng(t)).number_of_edges())
+        self.assertEqual(len(sweep.uniforms), 0)
+        # edge counts are Binomial(n(n-1), p)
+        for key, p in ((0.2, 0.2), (0.5, 0.5), ('plain', 0.2)):
+            M = n * (n - 1)
+            self.assertLess(abs(np.mean(counts[key]) - M * p), 4 * np.sqrt(M * p * (1 - p) / trials), key)
+        # no self-loops, and the batched graphs are those of getAuctionGraph
+        rngs = lambda: [np.random.default_rng(t) for t in range(5)]
+        for a, b in zip(plain.getAuctionGraphs(n, rngs()), [plain.getAuctionGraph(n, rng) for rng in rngs()]):
+            self.assertEqual(self.edges(a), self.edges(b))
+            self.assertFalse(any(u == v for u, v in self.edges(a)))
+        self.assertEqual(set(plain(n, 0).nodes[0]), set())
+
+    def test_invalid(self):
+        for p in (-0.1, 1.5, float('nan')):
+            with self.assertRaises(ValueError):
+                GNP(p)
+        sweep = GNPSweep()
+        a, b = GNP(0.1, sweep = sweep), GNP(0.3, sweep = sweep)
+        a.getAuctionGraph(20, np.random.default_rng(1))
+        # the same trial with another number of nodes
+        with self.assertRaises(ValueError):
+            b.getAuctionGraph(30, np.random.default_rng(1))
 
-    def __call__(self, n: int) -> nx.DiGraph:
-        return nx.fast_gnp_random_graph(n, self.p, seed=None, directed=True)
\ No newline at end of file
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
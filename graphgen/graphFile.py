@@ -0,0 +1,133 @@
+import networkx as nx
+import numpy as np
+import os
+import pickle
+import struct
+import sys
+import tempfile
+import unittest
+from typing import Union
+from mechanism.auctionGraph import AuctionGraph
+
+# A compact binary graph file (.csr) that is opened with np.memmap, so loading
+# is near-instant and the pages are shared by every process reading the file.
+# Layout: a 32-byte header (magic, n, m, flags) followed by the little-endian
+# arrays indptr int64[n+1], indices int32[m], rindptr int64[n+1],
+# rindices int32[m] and, if flags & LABELS, the node labels int64[n], each
+# starting at a multiple of 8 bytes.
+MAGIC = b'DACSR\x00\x00\x01'
+HEADER = struct.Struct('<8sqqq')
+LABELS = 1
+
+def layout(n: int, m: int, flags: int):
+    # (name, dtype, length, offset) of every array in the file
+    arrays = [('indptr', '<i8', n + 1), ('indices', '<i4', m),
+        ('rindptr', '<i8', n + 1), ('rindices', '<i4', m)]
+    if flags & LABELS:
+        arrays.append(('labels', '<i8', n))
+    offset = HEADER.size
+    result = []
+    for name, dtype, length in arrays:
+        result.append((name, dtype, length, offset))
+        offset += -(-length * np.dtype(dtype).itemsize // 8) * 8
+    return result, offset
+
+def saveGraph(filename: str, G: Union[nx.DiGraph, AuctionGraph]):
+    if isinstance(G, nx.Graph):
+        G = AuctionGraph.fromNetworkx(G, bid = None)
+    n, m = len(G), G.number_of_edges()
+    flags = 0
+    labels = None
+    if not isinstance(G.nodes, range) or G.nodes != range(n):
+        if not all(isinstance(x, (int, np.integer)) for x in G.nodes):
+            raise ValueError('only integer node labels can be stored in a graph file')
+        flags |= LABELS
+        labels = np.asarray(G.nodes, dtype=np.int64)
+    values = {'indptr': G.indptr, 'indices': G.indices, 'rindptr': G.rindptr,
+        'rindices': G.rindices, 'labels': labels}
+    arrays, size = layout(n, m, flags)
+    with open(filename, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, n, m, flags))
+        for name, dtype, length, offset in arrays:
+            f.seek(offset)
+            f.write(np.ascontiguousarray(values[name], dtype=dtype).tobytes())
+        f.truncate(size)
+
+def loadGraph(filename: str) -> AuctionGraph:
+    # a read-only AuctionGraph whose adjacency arrays are memory-mapped
+    with open(filename, 'rb') as f:
+        magic, n, m, flags = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError(f'{filename} is not a graph file')
+    arrays, _ = layout(n, m, flags)
+    values = {name: np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=(length,))
+        for name, dtype, length, offset in arrays}
+    nodes = None
+    if flags & LABELS:
+        nodes = values['labels'].tolist()
+    return AuctionGraph(values['indptr'], values['indices'], None, nodes,
+        rindptr = values['rindptr'], rindices = values['rindices'])
+
+def compactName(filename: str) -> str:
+    return os.path.splitext(filename)[0] + '.csr'
+
+def convert(filename: str) -> str:
+    # write the graph file next to a pickled networkx graph (.gpickle); it is
+    # written under a temporary name and renamed, so concurrent readers never
+    # see a partial file
+    with open(filename, 'rb') as f:
+        G = pickle.load(f)
+    target = compactName(filename)
+    temporary = f'{target}.{os.getpid()}.tmp'
+    try:
+        saveGraph(temporary, G)
+        os.replace(temporary, target)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    return target
+
+class TestGraphFile(unittest.TestCase):
+    def test_roundtrip(self):
+        from graphgen.staticFile import StaticFile
+        G = nx.gnp_random_graph(40, 0.1, seed = 1, directed = True)
+        G = nx.relabel_nodes(G, {k: 1000 - 7 * k for k in G.nodes})
+        G.add_node(5)
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'G.gpickle')
+            with open(filename, 'wb') as f:
+                pickle.dump(G, f)
+            reference = AuctionGraph.fromNetworkx(G, bid = None)
+            # the first load converts the pickle, later ones map the graph file
+            static = StaticFile(filename)
+            self.assertTrue(os.path.exists(compactName(filename)))
+            for graph in (static.auctionGraph, loadGraph(compactName(filename)), pickle.loads(pickle.dumps(static)).auctionGraph):
+                for name in ('indptr', 'indices', 'rindptr', 'rindices'):
+                    self.assertTrue(np.array_equal(getattr(graph, name), getattr(reference, name)), name)
+                    self.assertFalse(getattr(graph, name).flags.writeable)
+                self.assertEqual(list(graph.nodes), list(reference.nodes))
+            with self.assertRaises(ValueError):
+                static.auctionGraph.indices[0] = 1
+            # header and arrays start at multiples of 8, labels only if needed
+            with open(compactName(filename), 'rb') as f:
+                magic, n, m, flags = HEADER.unpack(f.read(HEADER.size))
+            arrays, size = layout(n, m, flags)
+            self.assertEqual((magic, n, m, flags), (MAGIC, 41, G.number_of_edges(), LABELS))
+            self.assertEqual(os.path.getsize(compactName(filename)), size)
+            self.assertTrue(all(offset % 8 == 0 for _, _, _, offset in arrays))
+            plain = os.path.join(directory, 'plain.csr')
+            saveGraph(plain, nx.convert_node_labels_to_integers(G))
+            with open(plain, 'rb') as f:
+                self.assertEqual(HEADER.unpack(f.read(HEADER.size))[3], 0)
+            self.assertEqual(loadGraph(plain).nodes, range(41))
+            # labels that cannot be stored stay on the pickle path
+            named = os.path.join(directory, 'named.gpickle')
+            with open(named, 'wb') as f:
+                pickle.dump(nx.relabel_nodes(G, str), f)
+            self.assertEqual(StaticFile(named).auctionGraph.nodes[0], str(reference.nodes[0]))
+            self.assertFalse(os.path.exists(compactName(named)))
+
+if __name__ == '__main__':
+    # python -m graphgen.graphFile data/static_graph/*.gpickle
+    for filename in sys.argv[1:]:
+        print(f'{filename} -> {convert(filename)}')
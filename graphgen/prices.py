@@ -1,7 +1,41 @@
 import networkx as nx
 import numpy as np
 import random
+import unittest
 from .genBase import GraphGen
+from mechanism.auctionGraph import AuctionGraph
+
+class FenwickTree:
+    # prefix sums over n non-negative weights with O(log n) update and
+    # O(log n) inverse lookup, for weighted sampling from a changing set
+    def __init__(self, n: int):
+        self.n = n
+        self.tree = [0.0] * (n + 1)
+        self.top = 1 << (n.bit_length() - 1) if n > 0 else 0
+
+    def add(self, i: int, delta: float):
+        i += 1
+        while i <= self.n:
+            self.tree[i] += delta
+            i += i & -i
+
+    def total(self) -> float:
+        i, s = self.n, 0.0
+        while i > 0:
+            s += self.tree[i]
+            i -= i & -i
+        return s
+
+    def find(self, x: float) -> int:
+        # the smallest index whose prefix sum exceeds x
+        tree, pos, bit = self.tree, 0, self.top
+        while bit:
+            nxt = pos + bit
+            if nxt <= self.n and tree[nxt] <= x:
+                pos = nxt
+                x -= tree[nxt]
+            bit >>= 1
+        return pos
 
 class Price_s(GraphGen):
     def __init__(self, m: int, c = 1, gamma = 1):
@@ -12,35 +46,98 @@ class Price_s(GraphGen):
         #  \frac{(k + c) ^ gamma * p_k}{\sum_k {(k + c) ^ gamma * p_k}}
         # where p_k denotes the fraction of nodes with in-degree k
 
-    @staticmethod
-    def getRandomSubset(sampleList, weight, sze):
-        targets = set()
-        while len(targets) < sze:
-            x = random.choices(sampleList, weights = weight)
-            targets.add(x[0])
-        return targets
+    def getEdges(self, n: int, rng: np.random.Generator):
+        # every new node i attaches to m distinct earlier nodes, drawn one by
+        # one proportionally to (k + c)^gamma among those not drawn yet; the
+        # weights live in a Fenwick tree, so each draw costs O(log n)
+        m = self.m
+        src = np.repeat(np.arange(m, n, dtype=np.int64), m)
+        dst = np.empty((n - m) * m, dtype=np.int64)
+        base = pow(self.c, self.gamma)
+        weight = [base] * n
+        degree = [0] * n
+        tree = FenwickTree(n)
+        for j in range(m):
+            tree.add(j, base)
+        uniform = rng.random((n - m, m)).tolist()
+        e = 0
+        for i in range(m, n):
+            targets = []
+            for u in uniform[i - m]:
+                j = tree.find(u * tree.total())
+                while j >= i or j in targets:
+                    # floating-point residue of a removed weight
+                    j = tree.find(rng.random() * tree.total())
+                targets.append(j)
+                tree.add(j, -weight[j])
+            for j in targets:
+                dst[e] = j
+                e += 1
+                # weights never decrease, as in the original list-based sampler
+                wDelta = pow(degree[j] + 1 + self.c, self.gamma) - pow(degree[j] + self.c, self.gamma)
+                degree[j] += 1
+                if wDelta > 0:
+                    weight[j] += wDelta
+                tree.add(j, weight[j])
+            tree.add(i, base)
+        return src, dst
+
+    def getAuctionGraph(self, n: int, rng = None) -> AuctionGraph:
+        if self.m < 1 or self.m >= n:
+            return AuctionGraph.fromEdges(n, [], [])
+        src, dst = self.getEdges(n, np.random.default_rng(rng))
+        return AuctionGraph.fromEdges(n, src, dst)
 
-    def __call__(self, n: int) -> nx.DiGraph:
+    def __call__(self, n: int, rng = None) -> nx.DiGraph:
         G = nx.DiGraph()
+        G.add_nodes_from(range(0, n))
         if self.m < 1 or self.m >= n: 
-            G.add_nodes_from(range(0, n))
             return G
+        src, dst = self.getEdges(n, np.random.default_rng(rng))
+        G.add_edges_from(zip(src.tolist(), dst.tolist()))
+        return G
 
-        G.add_nodes_from(range(0, self.m))
-        sampleList = list(range(0, self.m))
-        weight = [pow(self.c, self.gamma)] * self.m
+class TestPrices(unittest.TestCase):
+    def test_fenwick(self):
+        rng = np.random.default_rng(0)
+        weight = rng.random(37)
+        tree = FenwickTree(37)
+        for i, w in enumerate(weight):
+            tree.add(i, w)
+        tree.add(5, -weight[5])
+        weight[5] = 0
+        self.assertAlmostEqual(tree.total(), weight.sum())
+        prefix = np.cumsum(weight)
+        for x in rng.random(200) * weight.sum():
+            self.assertEqual(tree.find(x), int(np.searchsorted(prefix, x, side='right')))
 
-        for i in range(self.m, n):
-            G.add_node(i)
-            targets = Price_s.getRandomSubset(sampleList, weight, self.m)
-            for j in targets:
-                degree = G.in_degree(j)
-                wDelta = pow(degree + 1 + self.c, self.gamma) - pow(degree + self.c, self.gamma)
-                if wDelta > 0:
-                    sampleList.append(j)
-                    weight.append(wDelta)
-                G.add_edge(i, j)
-            sampleList.append(i)
-            weight.append(pow(self.c, self.gamma))
+    def test_degrees(self):
+        # in-degree statistics against the list-based sampler it replaced
+        def listBased(n, m, c, gamma, rand):
+            sampleList, weight, degree = list(range(m)), [pow(c, gamma)] * m, [0] * n
+            for i in range(m, n):
+                targets = set()
+                while len(targets) < m:
+                    targets.add(rand.choices(sampleList, weights = weight)[0])
+                for j in targets:
+                    wDelta = pow(degree[j] + 1 + c, gamma) - pow(degree[j] + c, gamma)
+                    if wDelta > 0:
+                        sampleList.append(j)
+                        weight.append(wDelta)
+                    degree[j] += 1
+                sampleList.append(i)
+                weight.append(pow(c, gamma))
+            return np.array(degree)
+        n, m, trials = 200, 3, 40
+        gen = Price_s(m = m)
+        new = np.array([np.bincount(gen.getEdges(n, np.random.default_rng(t))[1], minlength = n) for t in range(trials)])
+        rand = random.Random(0)
+        old = np.array([listBased(n, m, 1, 1, rand) for _ in range(trials)])
+        self.assertTrue((new.sum(axis = 1) == (n - m) * m).all())
+        self.assertTrue((gen.getAuctionGraph(n, 0).outDegree()[m:] == m).all())
+        for statistic in (lambda d: (d == 0).mean(axis = 1), lambda d: d.max(axis = 1), lambda d: d[:, :10].mean(axis = 1)):
+            a, b = statistic(new), statistic(old)
+            self.assertLess(abs(a.mean() - b.mean()), 4 * np.sqrt((a.var() + b.var()) / trials))
 
-        return G
\ No newline at end of file
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,54 @@
 import networkx as nx
+import os
+import pickle
 from .genBase import GraphGen
+from .graphFile import compactName, convert, loadGraph
+from mechanism.auctionGraph import AuctionGraph
 
 class StaticFile(GraphGen):
+    # A fixed graph read from a graph file (.csr), memory-mapped, or from a
+    # pickled networkx graph (.gpickle); a .gpickle is converted to a .csr
+    # next to it on first use (or with python -m graphgen.graphFile) and read
+    # from the .csr from then on, unless the graph cannot be stored in one
+    # (non-integer labels) or the directory is not writable.
+    deterministic = True
+
     def __init__(self, filename: str):
+        self.load(filename)
+
+    def load(self, filename: str):
         self.filename = filename
-        self.graph = nx.read_gpickle(self.filename)
+        compact = compactName(filename)
+        self.graph = None
+        if not os.path.exists(compact) and filename != compact:
+            try:
+                convert(filename)
+            except (OSError, ValueError):
+                pass
+        if os.path.exists(compact):
+            self.auctionGraph = loadGraph(compact)
+        else:
+            with open(filename, 'rb') as f:
+                self.graph = pickle.load(f)
+            self.auctionGraph = AuctionGraph.fromNetworkx(self.graph, bid = None)
+        graph = self.auctionGraph
+        for array in (graph.indptr, graph.indices, graph.rindptr, graph.rindices, graph.bid):
+            array.flags.writeable = False
+
+    def __getstate__(self):
+        # only the file name is sent to another process, which maps the
+        # graph file itself and so shares its pages with every other reader
+        return {'filename': self.filename}
+
+    def __setstate__(self, state):
+        self.load(state['filename'])
+
+    def __call__(self, n: int, rng = None) -> nx.DiGraph:
+        if self.graph is None:
+            self.graph = self.auctionGraph.toNetworkx(bid = None)
+        return self.graph.copy()
 
-    def __call__(self, _) -> nx.DiGraph:
-        return self.graph.copy()
\ No newline at end of file
+    def getAuctionGraph(self, n: int, rng = None) -> AuctionGraph:
+        # the one shared graph; its adjacency is read-only, and callers pass
+        # their bids with withBids instead of writing into it
+        return self.auctionGraph
\ No newline at end of file
@@ -1,30 +1,40 @@
-from dataclasses import dataclass
-import networkx as nx
 import scipy.stats as stats
-import random
-from typing import Tuple, Any
-import numpy as np
 from zipfian import ZipfGenerator
-import pandas as pd
 import sys
 
-from mechanism.mechanismBase import DiffusionAuction
 from mechanism.IDM import IDM
 from mechanism.STM import STM
 from mechanism.NSP import NSP
 from mechanism.SCM import SCM
 
-from graphgen.genBase import GraphGen
-from graphgen.gnp import GNP
+from graphgen.gnp import GNP, GNPSweep
 from graphgen.prices import Price_s
 # from graphgen.Schweimer22 import Schweimer22
 from graphgen.staticFile import StaticFile
-from multiprocessing import Pool
+
+from experiment.graphCache import GraphCache
+from experiment.pipeline import TrialSource
+from experiment.aggregator import Aggregator
+from experiment.resultStore import ResultSet
+from experiment.runner import runAdaptive, runExperiment
 
 # mode = 'FAST'
 mode = 'STANDARD'
 
 TEST_TIMES = 500
+# with a TARGET_WIDTH every cell runs from MIN_TRIALS until the 95% intervals
+# of its normalized SW and revenue are at most that wide (or it reaches
+# TEST_TIMES trials); None runs TEST_TIMES trials of every cell
+TARGET_WIDTH = None
+MIN_TRIALS = 50
+
+# graphs, sellers and bids are seeded from SEED; graphs and sellers are
+# generated, seeded and cached in blocks of TRIAL_BLOCK trials
+SEED = 0
+TRIAL_BLOCK = 50
+# pregenerated corpora are kept here between runs (None to disable)
+CACHE_DIR = 'data/cache'
+CACHE_BYTES = 4 << 30
 
 test_mechanisms = {
     'NSP': NSP(),
@@ -60,97 +70,57 @@ if mode == 'FAST':
         x: y for x, y in test_graphs.items() if y[1] < 500
     }
 
-pregenerated_graphs = {}
-pregenerated_seller = {}
-pregenerated_bids = {}
-
-def test(mechanism: DiffusionAuction, 
-        gname: str, 
-        dname: str,
-        i: int) -> DiffusionAuction.MechanismResult:
-    graph = pregenerated_graphs[gname][i].copy()
-    nodes = list(graph.nodes)
-    bids = dict(zip(nodes, pregenerated_bids[dname][i]))
-    seller = pregenerated_seller[gname][i]
-    bids[seller] = 1e-8
-    nx.set_node_attributes(graph, bids, 'bid')
-    return mechanism(graph, seller)
-
-data = {
-    "Graph Type": [], 
-    "Bid Type": [], 
-    "Mechanism": [], 
-    "Efficiency Ratio": [], 
-    "Normalized Revenue": []
-}
-
-def init():
-    global pregenerated_graphs, pregenerated_seller, pregenerated_bids
-    pregenerated_graphs = {name: [] for name in test_graphs}
-    pregenerated_seller = {name: [] for name in test_graphs}
-    pregenerated_bids = {name: [] for name in test_distributions}
-
-    max_n = 0
-    for gname in test_graphs:
-        for i in range(TEST_TIMES):
-            print(f'Pregenerating graph {gname} {i}')
-            graphconf = test_graphs[gname]
-            graphgen, n = graphconf
-            graph = graphgen(n)
-            max_n = max(max_n, len(graph.nodes))
-            pregenerated_graphs[gname].append(graph)
-            degree_threshold = graph.number_of_edges() / len(graph.nodes)
-            deg = dict(graph.degree())
-            out_deg = dict(graph.out_degree())
-            pregenerated_seller[gname].append(random.choice([x for x in graph.nodes if deg[x] >= degree_threshold and out_deg[x] >= 1]))
-    
-    for dname in test_distributions:
-        print(f'Pregenerating bid {dname}')
-        distribution = test_distributions[dname]
-        for i in range(TEST_TIMES):
-            pregenerated_bids[dname].append(distribution.rvs(max_n))
+# every (graph, block of trials) is a work unit run on a pool of PROCESSES
+# processes (None for all cores), costliest first and with the costliest
+# blocks split into smaller batches; a worker generates the trials of its
+# unit and keeps the topologies of up to TOPOLOGY_CACHE (graph, seller) warm
+PROCESSES = None
+TOPOLOGY_CACHE = TRIAL_BLOCK
+# with PROCESSES = 1, up to PREFETCH trials are generated ahead in a thread
+# while the current ones are evaluated, which pays off only with a spare core
+# (0 generates them in turn)
+PREFETCH = 0
+graph_cache = GraphCache(CACHE_DIR, CACHE_BYTES) if CACHE_DIR is not None else None
+trial_source = TrialSource(SEED, TRIAL_BLOCK, graph_cache)
 
 def main(argv):
-    pid = argv[1]
+    # python main.py [k K] runs shard k of K (every K-th work unit from the
+    # k-th); shards can run on any machine and are combined with
+    # python -m experiment.resultStore --merge data/merged data/results*
+    # Every shard is seeded from SEED, so runs must differ in k to differ.
+    if len(argv) not in (1, 3):
+        sys.exit(f'usage: {argv[0]} [k K] runs shard k of K (all of the experiment by default)')
+    shard = (int(argv[1]), int(argv[2])) if len(argv) == 3 else (0, 1)
+    if not 0 <= shard[0] < shard[1]:
+        sys.exit(f'shard {shard[0]} of {shard[1]} does not exist')
+    pid = shard[0]
     print(pid)
-    data = []
-
-    for gname in test_graphs:
-        for dname in test_distributions:
-            for mname, mechanism in test_mechanisms.items():
-                results = list(map(lambda i: test(mechanism, gname, dname, i), list(range(TEST_TIMES))))
-                SW = list(map(lambda x: x.socialWelfare, results))
-                rev = list(map(lambda x: x.revenue, results))
-                opt = list(map(lambda x: x.Optimal, results))
-                print(f'{gname} {dname} {mname}, Normlized SW {np.sum(SW) / np.sum(opt):.4f}, normalized revenue {np.sum(rev) / np.sum(opt):.4f}')
-                #eff_ratio = list(map(lambda x: x.efficiencyRatio, results))
-                #normalized_revenue = list(map(lambda x: x.normalizedRevenue, results)) 
-                #print(f'{gname} {dname} {mname}, efficiency ratio {np.mean(eff_ratio):.4f}, normalized revenue {np.mean(normalized_revenue):.4f}')
-                
-                # store the data
-                #data["Graph Type"].append(gname)
-                #data["Bid Type"].append(dname)
-                #data["Mechanism"].append(mname)
-                #data["Efficiency Ratio"].append(np.mean(eff_ratio))
-                #data["Normalized Revenue"].append(np.mean(normalized_revenue))
-                                # store the data
-                data.append(SW)
-                data.append(rev)
-                data.append(opt)
-                with open(f'data/labels{pid}','a',encoding="utf-8") as f:
-                    f.write(f'{gname} {dname} {mname} '+"\n")
-
-    data = np.array(data).reshape(len(test_graphs), len(test_distributions), len(test_mechanisms), -1)
-    data.tofile(f'data/results{pid}')
-    #dataFrame = pd.DataFrame(data)
-    #dataFrame.to_csv('data/result.csv')
+    # one record per graph, distribution, mechanism and trial, in a result
+    # shard that can be read back with experiment.resultStore; a run into an
+    # existing shard resumes it and only computes the cells it is missing
+    # (delete the directory to start over)
+    directory = f'data/results{pid}'
+    if TARGET_WIDTH is None:
+        runExperiment(trial_source, test_graphs, test_distributions, test_mechanisms,
+            TEST_TIMES, directory, PROCESSES, TOPOLOGY_CACHE, shard = shard, depth = PREFETCH)
+        aggregator = Aggregator(test_graphs, test_distributions, test_mechanisms)
+        aggregator.addResults(ResultSet([directory]))
+    else:
+        aggregator = runAdaptive(trial_source, test_graphs, test_distributions, test_mechanisms,
+            TARGET_WIDTH, MIN_TRIALS, TEST_TIMES, directory, PROCESSES, TOPOLOGY_CACHE, shard = shard,
+            depth = PREFETCH)
+
+    for line in aggregator.summary():
+        print(line)
 
 if __name__ == '__main__':
+    # the p of the sweep share their random numbers, so the graphs of
+    # one trial are nested in p and generated from a single draw
+    sweep = GNPSweep()
     for i in range(0, 20):
        p, n = (i+1) / 20.0, 100
        gname = 'GNP p=%.2f n=%d'%(p,n)
        print(gname)
-       test_graphs.update({gname: (GNP(p), n)})
+       test_graphs.update({gname: (GNP(p, sweep = sweep), n)})
        #test_graphs[gname] = 
-    init()
     main(sys.argv)
\ No newline at end of file
@@ -1,81 +1,107 @@
 import networkx as nx
+import numpy as np
 import unittest
 
 try:
     import mechanismBase
+    from auctionGraph import AuctionGraph
 except ImportError:
     import mechanism.mechanismBase as mechanismBase
+    from mechanism.auctionGraph import AuctionGraph
 
 class IDM(mechanismBase.DiffusionAuction):
     name = "IDM"
     
     @staticmethod
-    def getPrice(G, seller, bid, idom, H):
-        # H is the set of reachable vertexes from seller
-        dist = nx.single_source_shortest_path_length(G, seller)
-        domTree = nx.DiGraph()
-        domTree.add_node(seller)
-        for i in H:
-            if i != seller: 
-                domTree.add_edge(idom[i], i)
-
-        H.sort(key = (lambda i: dist[i]))
-        #the maximum bid of i's subtree in domTree Graph, denoted as maxbid
-        maxbid = {}
-        for i in reversed(H):
-            maxbid[i] = max([maxbid[j] for j in domTree.successors(i)] + [bid[i]])
-        price = {seller: 0}
-        for i in H:
-            adj = list(domTree.successors(i))
-            val = [maxbid[j] for j in adj]
-            preMaxVal = [0] * (len(adj) + 1)
-            for jx in range(0, len(adj)):
-                preMaxVal[jx + 1] = max(preMaxVal[jx], val[jx])
-            sufMaxVal = [0] * (len(adj) + 1)
-            for jx in range(len(adj) - 1, -1, -1):
-                sufMaxVal[jx - 1] = max(sufMaxVal[jx], val[jx])
-            for jx in range(0, len(adj)):
-                price[adj[jx]] = max(price[i], bid[i], preMaxVal[jx], sufMaxVal[jx])
+    def getPrice(topology, bid):
+        # bid is a float array over the node indices of topology, or a (K x n)
+        # matrix of K bid profiles priced together
+        order, levelPtr, idom = topology.order, topology.levelPtr, topology.idom
+        children, childPtr = topology.children, topology.childPtr
+        n = bid.shape[-1]
+        #the maximum bid of i's subtree in the dominator tree, denoted as maxbid.
+        #A node's idom is always on a smaller BFS level, so sweeping the levels
+        #bottom-up finishes every subtree before it is pushed to its parent
+        maxbid = bid.copy()
+        for d in range(len(levelPtr) - 2, 0, -1):
+            level = order[levelPtr[d]:levelPtr[d + 1]]
+            np.maximum.at(maxbid, (..., idom[level]), maxbid[..., level])
+        price = np.zeros(bid.shape)
+        if len(children) == 0:
+            return price, maxbid
+
+        #top-2 of maxbid among the children of every node, by segmented
+        #reductions over the child offsets; the max over my siblings is the
+        #top-1 of my parent unless I am (the first) top-1 child myself
+        counts = np.diff(childPtr)
+        parent = np.repeat(np.arange(n), counts)
+        starts = childPtr[:-1][counts > 0]
+        val = maxbid[..., children]
+        top1 = np.zeros(bid.shape)
+        top1[..., counts > 0] = np.maximum.reduceat(val, starts, axis=-1)
+        slot = np.where(val == top1[..., parent], np.arange(len(children)), len(children))
+        first = np.minimum.reduceat(slot, starts, axis=-1)
+        np.put_along_axis(val, first, 0, axis=-1)
+        top2 = np.zeros(bid.shape)
+        top2[..., counts > 0] = np.maximum.reduceat(val, starts, axis=-1)
+        siblingMax = top1[..., parent]
+        np.put_along_axis(siblingMax, first, np.take_along_axis(top2, parent[first], axis=-1), axis=-1)
+
+        #price of a child is max(price of parent, bid of parent, max over
+        #siblings), pushed down the tree level by level
+        base = np.zeros(bid.shape)
+        base[..., children] = np.maximum(bid[..., parent], siblingMax)
+        for d in range(1, len(levelPtr) - 1):
+            level = order[levelPtr[d]:levelPtr[d + 1]]
+            price[..., level] = np.maximum(price[..., idom[level]], base[..., level])
 
         return price, maxbid
 
     @staticmethod
-    def getDiffSeq(seller, reachableNodes, idom, bid):
+    def getDiffSeq(topology, bid):
         # get diffusion sequence C_{x^*} = {c_0 = s, c_1, c_2, ..., c_l = x^*}
-        mxBidder = seller
-        for i in reachableNodes:
-            if bid[i] > bid[mxBidder]: mxBidder = i
+        # the first highest bidder in BFS order, the seller if nobody bids more
+        seller, idom = topology.root, topology.idom
+        mxBidder = int(topology.order[np.argmax(bid[topology.order])])
         diffusionSeq, x = [], mxBidder
         while x != seller:
             diffusionSeq.append(x)
-            x = idom[x]
+            x = int(idom[x])
         diffusionSeq.append(seller)
         diffusionSeq.reverse()
         return mxBidder, diffusionSeq
 
-    def __call__(self, G, seller):
-        bid = G.nodes.data("bid")
-        idom = nx.immediate_dominators(G, seller)
-        reachableNodes = list(nx.descendants(G, seller)) + [seller]
-        price, maxAlpha = IDM.getPrice(G, seller, bid, idom, reachableNodes)
-        mxBidder, diffusionSeq = IDM.getDiffSeq(seller, reachableNodes, idom, bid)
-
-        winner = -1
-        monetaryTransfer = dict(zip(G.nodes, [0] * len(G.nodes)))
-
+    @staticmethod
+    def getTransfer(topology, bid, price):
+        seller = topology.root
+        mxBidder, diffusionSeq = IDM.getDiffSeq(topology, bid)
+        monetaryTransfer = {}
         if len(diffusionSeq) == 1:
-            winner = diffusionSeq[0]
-            return mechanismBase.DiffusionAuction.MechanismResult(seller, winner, monetaryTransfer, G)
+            return seller, monetaryTransfer
 
         for ix, i in enumerate(diffusionSeq):
             if ((i == mxBidder) or (price[diffusionSeq[ix + 1]] == bid[i])) and (i != seller):
                 winner = i
-                monetaryTransfer[i] = -price[i]
+                monetaryTransfer[i] = -float(price[i])
                 break
             else:
-                monetaryTransfer[i] = price[diffusionSeq[ix + 1]] - price[i]
+                monetaryTransfer[i] = float(price[diffusionSeq[ix + 1]] - price[i])
+
+        return winner, monetaryTransfer
 
-        return mechanismBase.DiffusionAuction.MechanismResult(seller, winner, monetaryTransfer, G)
+    def allocate(self, topology, bid):
+        price, maxAlpha = IDM.getPrice(topology, bid)
+        return IDM.getTransfer(topology, bid, price)
+
+    def allocateBatch(self, topology, bids):
+        # the prices of all K profiles come from one vectorized pass
+        price, maxAlpha = IDM.getPrice(topology, bids)
+        winner = np.empty(len(bids), dtype=np.int64)
+        revenue = np.empty(len(bids))
+        for k in range(len(bids)):
+            winner[k], transfer = IDM.getTransfer(topology, bids[k], price[k])
+            revenue[k] = transfer.get(topology.root, 0)
+        return winner, revenue
 
 class TestIDM(unittest.TestCase):
     def testIDM_hand(self):
@@ -112,6 +138,28 @@ class TestIDM(unittest.TestCase):
         self.assertEqual(result.winner, 'I')
         self.assertEqual(result.monetaryTransfer['I'], -11)
         self.assertEqual(result.monetaryTransfer['C'], 1)
+        result = mechanism(AuctionGraph.fromNetworkx(G), seller)
+        self.assertEqual(result.winner, 'I')
+        self.assertEqual(result.monetaryTransfer['I'], -11)
+
+    def testIDM_batch(self):
+        mechanism = IDM()
+        G = nx.DiGraph()
+        E = [(0, 1), (0, 2), (0, 3), (0, 4), (1, 5), (2, 5), (3, 6), (5, 7), (8, 9)]
+        G.add_edges_from(E)
+        bids = [[0, 2, 3, 5, 7, 11, 13, 17, 19, 23],
+                [0, 2, 3, 5, 7, 11, 13, 5, 19, 23],
+                [0, 9, 3, 5, 7, 11, 13, 17, 19, 23]]
+        seller = 0
+        batch = mechanism.runBatch(G, seller, bids)
+        self.assertEqual(batch.revenue[0], 13)
+        self.assertEqual(batch.socialWelfare[0], 17)
+        for k, bid in enumerate(bids):
+            nx.set_node_attributes(G, dict(enumerate(bid)), "bid")
+            result = mechanism(G, seller)
+            self.assertEqual(batch.winner[k], result.winner)
+            self.assertEqual(batch.revenue[k], result.revenue)
+            self.assertEqual(batch.Optimal[k], result.Optimal)
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
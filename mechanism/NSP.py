@@ -1,6 +1,6 @@
 import networkx as nx
+import numpy as np
 import unittest
-import itertools
 
 try:
     import mechanismBase
@@ -10,20 +10,30 @@ except ImportError:
 class NSP(mechanismBase.DiffusionAuction):
     name = "NSP"
 
-    def __call__(self, G, seller):
-        winner, maxBid, secPrice = seller, 0, 0
-        bid = G.nodes.data("bid")
-        for i in G.neighbors(seller):
-            if bid[i] > maxBid:
-                secPrice = maxBid
-                maxBid = bid[i]
-                winner = i
-            elif bid[i] > secPrice:
-                secPrice = bid[i]
-        monetaryTransfer = dict(zip(G.nodes, itertools.repeat(0)))
-        monetaryTransfer[seller] += secPrice
-        monetaryTransfer[winner] -= secPrice
-        return mechanismBase.DiffusionAuction.MechanismResult(seller, winner, monetaryTransfer, G)
+    def allocate(self, topology, bid):
+        winner, revenue = self.allocateBatch(topology, bid[None, :])
+        winner, revenue = int(winner[0]), float(revenue[0])
+        transfer = {topology.root: revenue}
+        if winner != topology.root:
+            transfer[winner] = -revenue
+        return winner, transfer
+
+    def allocateBatch(self, topology, bids):
+        # the first highest bidder among the seller's neighbours wins and pays
+        # the second highest neighbour bid (0 if nobody bids above 0)
+        root = topology.root
+        neighbors = topology.indices[topology.indptr[root]:topology.indptr[root + 1]]
+        if len(neighbors) == 0:
+            return np.full(len(bids), root, dtype=np.int64), np.zeros(len(bids))
+        val = bids[:, neighbors]
+        best = np.argmax(val, axis=1)
+        maxBid = val[np.arange(len(bids)), best]
+        secPrice = np.zeros(len(bids))
+        if len(neighbors) > 1:
+            secPrice = np.maximum(np.sort(val, axis=1)[:, -2], 0)
+        winner = np.where(maxBid > 0, neighbors[best], root)
+        revenue = np.where(maxBid > 0, secPrice, 0)
+        return winner.astype(np.int64), revenue
 
 class TestNSP(unittest.TestCase):
     def test_NSP(self):
@@ -44,6 +54,20 @@ class TestNSP(unittest.TestCase):
         self.assertEqual(result.socialWelfare, 7)
         self.assertAlmostEqual(result.efficiencyRatio, 0.4117647058823529)
 
+    def test_NSP_batch(self):
+        mechanism = NSP()
+        G = nx.DiGraph()
+        E = [(0, 1), (0, 2), (0, 3), (0, 4), (1, 5), (2, 5), (3, 6), (5, 7), (8, 9)]
+        G.add_edges_from(E)
+        bids = [[0, 2, 3, 5, 7, 11, 13, 17, 19, 23],
+                [0, 7, 3, 7, 2, 11, 13, 17, 19, 23],
+                [0, 0, 0, 0, 0, 11, 13, 17, 19, 23]]
+        result = mechanism.runBatch(G, 0, bids)
+        self.assertEqual(result.winner.tolist(), [4, 1, 0])
+        self.assertEqual(result.revenue.tolist(), [5, 7, 0])
+        self.assertEqual(result.socialWelfare.tolist(), [7, 7, 0])
+        self.assertEqual(result.Optimal.tolist(), [17, 17, 17])
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
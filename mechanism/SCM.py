@@ -1,39 +1,46 @@
-from random import randint
 import networkx as nx
+import numpy as np
 import unittest
 
 try:
     import mechanismBase
     import STM
+    from topology import Topology
 except ImportError:
     import mechanism.mechanismBase as mechanismBase
     import mechanism.STM as STM
+    from mechanism.topology import Topology
     
 class SCM(mechanismBase.DiffusionAuction):
     name = "SCM"
     
-    def __init__(self):
+    def __init__(self, seed = None):
         super().__init__()
         self.stm = STM.STM()
+        self.rng = np.random.default_rng(seed)
 
     @staticmethod
-    def getSybilClusterIndex(G, seller, Gamma):
-        dist = nx.single_source_shortest_path_length(G, seller)
-        reachableNodes = list(filter(lambda i: nx.has_path(G, seller, i), G.nodes))
-        reachableNodes.sort(key = (lambda i: dist[i]))
-        idom = nx.immediate_dominators(G, seller)
-        clusterIndex = {}
-        for i in reachableNodes:
-            if i in Gamma:
-                clusterIndex[i] = i
-            else:
-                clusterIndex[i] = clusterIndex[idom[i]]
+    def getSybilClusterIndex(G, seller, Gamma, topology=None):
+        # cluster of every reachable node index: its ancestor in Gamma on the
+        # dominator tree (or the seller itself), -1 for unreachable nodes
+        if topology is None:
+            topology = Topology(G, seller)
+        order, levelPtr, idom = topology.order, topology.levelPtr, topology.idom
+        clusterIndex = np.full(len(topology.nodes), -1, dtype=np.int64)
+        clusterIndex[topology.root] = topology.root
+        clusterIndex[Gamma] = Gamma
+        for d in range(1, len(levelPtr) - 1):
+            level = order[levelPtr[d]:levelPtr[d + 1]]
+            level = level[clusterIndex[level] == -1]
+            clusterIndex[level] = clusterIndex[idom[level]]
         return clusterIndex
 
     @staticmethod
-    def getRSPTree(G, source): # get Random Shortest Path Tree 
+    def getRSPTree(G, source, rng = None): # get Random Shortest Path Tree 
+        rng = np.random.default_rng(rng)
+        # the BFS distances also tell which nodes are reachable
         dist = nx.single_source_shortest_path_length(G, source)
-        reachableNodes = list(filter(lambda i: nx.has_path(G, source, i), G.nodes))
+        reachableNodes = [i for i in G.nodes if i in dist]
         reachableNodes.sort(key = (lambda i: dist[i]))
         Tree = nx.DiGraph()
         for i in reachableNodes:
@@ -41,30 +48,41 @@ class SCM(mechanismBase.DiffusionAuction):
                 fromList = []
                 for j in G.predecessors(i):
                     if dist[j] + 1 == dist[i]: fromList.append(j)
-                Tree.add_edge(fromList[randint(0, len(fromList) - 1)], i)
+                Tree.add_edge(fromList[rng.integers(len(fromList))], i)
         return Tree
 
-    def __call__(self, G, seller):
-        reachable = nx.descendants(G, seller) | set([seller])
-        Gamma = STM.STM.getTopoGamma(G, seller)
-        clusterIndex = SCM.getSybilClusterIndex(G, seller, Gamma)
+    def allocate(self, topology, bid):
+        nodes, root = topology.nodes, topology.root
+        n = len(nodes)
+        Gamma = topology.Gamma
+        clusterIndex = SCM.getSybilClusterIndex(None, topology.seller, Gamma, topology)
+        # the edges in CSR order whose endpoints lie in different clusters
+        src = np.repeat(np.arange(n), np.diff(topology.indptr))
+        dst = topology.indices
+        cross = topology.reachable[src] & (clusterIndex[src] != clusterIndex[dst])
+        clusterSrc, clusterDst = clusterIndex[src[cross]], clusterIndex[dst[cross]]
         clustersGraph = nx.DiGraph()
-        clustersGraph.add_node(seller)
-        for i, j in G.edges():
-            if i in reachable and clusterIndex[i] != clusterIndex[j]:
-                clustersGraph.add_edge(clusterIndex[i], clusterIndex[j])
+        clustersGraph.add_node(root)
+        clustersGraph.add_edges_from(zip(clusterSrc.tolist(), clusterDst.tolist()))
         
-        clustersTree = SCM.getRSPTree(clustersGraph, seller)
-        subG = G.copy()
-        for i, j in G.edges():
-            if i in reachable and clusterIndex[i] != clusterIndex[j]:
-                if not clustersTree.has_edge(clusterIndex[i], clusterIndex[j]): 
-                    subG.remove_edge(i, j)
-        return self.stm(subG, seller, Gamma)
+        clustersTree = SCM.getRSPTree(clustersGraph, root, self.rng)
+        treeParent = np.full(n, -1, dtype=np.int64)
+        for ci, cj in clustersTree.edges():
+            treeParent[cj] = ci
+        # the pruned graph is a filtered CSR view of the original adjacency:
+        # inter-cluster edges survive only along the random shortest-path tree
+        keep = ~cross
+        keep[cross] = treeParent[clusterDst] == clusterSrc
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(np.bincount(src[keep], minlength=n))
+        subTopology = Topology.fromCSR(topology.seller, nodes, topology.index, indptr, dst[keep])
+        return self.stm.allocate(subTopology, bid, Gamma)
 
 class TestSCM(unittest.TestCase):
     def testSCM_hand(self):
-        scm = SCM()
+        # the revenue depends on the random shortest-path tree (13 or 17),
+        # so the tree is drawn from a fixed seed
+        scm = SCM(seed = 1)
         G = nx.DiGraph()
         E = [(0, 1), (0, 2), (0, 3), (1, 4), (1, 5), (3, 6), (4, 7), (5, 7), (6, 7), (3, 8), (100, 101)]
         G.add_edges_from(E)
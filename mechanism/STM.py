@@ -1,65 +1,88 @@
 import networkx as nx
+import numpy as np
 import unittest
 
 try:
     import mechanismBase
     import IDM
+    from topology import Topology
 except ImportError:
     import mechanism.mechanismBase as mechanismBase
     import mechanism.IDM as IDM
+    from mechanism.topology import Topology
 
 class STM(mechanismBase.DiffusionAuction):
     name = "STM"
 
     @staticmethod
-    def getTopoGamma(G, seller):
-        idom = nx.immediate_dominators(G, seller)
-        Gamma = []
-        for i in list(G.nodes):
-            if (nx.has_path(G, seller, i) and idom[i] == seller):
-                Gamma.append(i)
-        return Gamma
+    def getTopoGamma(G, seller, topology=None):
+        # the labels of the seller and the reachable nodes it immediately
+        # dominates, in the node order of G
+        if topology is None:
+            topology = Topology(G, seller)
+        Gamma = np.sort(np.append(topology.Gamma, topology.root))
+        return [topology.nodes[i] for i in Gamma.tolist()]
 
-    def __call__(self, G, seller, Gamma=None):
-        bid = G.nodes.data("bid")
-        if Gamma == None:
-            Gamma = STM.getTopoGamma(G, seller)
-
-        idom = nx.immediate_dominators(G, seller)
-        reachableNodes = list(filter(lambda i: nx.has_path(G, seller, i), G.nodes))
-        p, maxAlpha = IDM.IDM.getPrice(G, seller, bid, idom, reachableNodes)
-        mxBidder, diffusionSeq = IDM.IDM.getDiffSeq(seller, reachableNodes, idom, bid)
+    @staticmethod
+    def getTransfer(topology, bid, p, maxAlpha, Gamma):
+        seller, idom = topology.root, topology.idom
+        mxBidder, diffusionSeq = IDM.IDM.getDiffSeq(topology, bid)
 
         q = {}
         for ix in range(0, len(diffusionSeq)):
             i = diffusionSeq[ix]
             q[i] = p[i]
 
-        for y in Gamma:
-            if not (y in diffusionSeq):
-                z = idom[y]
-                while not (z in diffusionSeq):
-                    z = idom[z]
+        for y in Gamma.tolist():
+            if not (y in q) and topology.reachable[y]:
+                z = int(idom[y])
+                while not (z in q):
+                    z = int(idom[z])
                 q[z] = max(q[z], maxAlpha[y])
                 
-        winner = -1
-        monetaryTransfer = dict(zip(G.nodes, [0] * len(G.nodes)))
+        monetaryTransfer = {seller: 0.0}
         
         if len(diffusionSeq) == 1:
-            winner = diffusionSeq[0]
-            return mechanismBase.DiffusionAuction.MechanismResult(seller, winner, monetaryTransfer, G)
+            return seller, monetaryTransfer
             
         for ix, i in enumerate(diffusionSeq):
             if ((i == mxBidder) or (bid[i] >= q[i])) and (i != seller):
                 winner = i
-                monetaryTransfer[i] = -p[i]
-                monetaryTransfer[seller] += p[i]
+                monetaryTransfer[i] = -float(p[i])
+                monetaryTransfer[seller] += float(p[i])
                 break
-            else:
-                monetaryTransfer[i] = q[i] - p[i]
-                monetaryTransfer[seller] -= q[i] - p[i]
+            elif i != seller:
+                monetaryTransfer[i] = float(q[i] - p[i])
+                monetaryTransfer[seller] -= float(q[i] - p[i])
+
+        return winner, monetaryTransfer
 
-        return mechanismBase.DiffusionAuction.MechanismResult(seller, winner, monetaryTransfer, G)
+    def __call__(self, G, seller, Gamma=None, *, topology=None):
+        # Gamma, if given, is a list of node labels as from getTopoGamma
+        if topology is None:
+            topology = Topology(G, seller)
+        if Gamma is not None:
+            Gamma = np.array([topology.index[y] for y in Gamma], dtype=np.int64)
+        bid = topology.getBids(G)
+        winner, transfer = self.allocate(topology, bid, Gamma)
+        return mechanismBase.DiffusionAuction.MechanismResult(topology, winner, transfer, bid)
+
+    def allocate(self, topology, bid, Gamma=None):
+        # Gamma, if given, holds node indices of a graph with the same node
+        # order as topology (SCM passes the Gamma of the unpruned graph)
+        if Gamma is None:
+            Gamma = topology.Gamma
+        p, maxAlpha = IDM.IDM.getPrice(topology, bid)
+        return STM.getTransfer(topology, bid, p, maxAlpha, Gamma)
+
+    def allocateBatch(self, topology, bids):
+        p, maxAlpha = IDM.IDM.getPrice(topology, bids)
+        winner = np.empty(len(bids), dtype=np.int64)
+        revenue = np.empty(len(bids))
+        for k in range(len(bids)):
+            winner[k], transfer = STM.getTransfer(topology, bids[k], p[k], maxAlpha[k], topology.Gamma)
+            revenue[k] = transfer[topology.root]
+        return winner, revenue
 
 class TestSTM(unittest.TestCase):
     def testSTM_hand(self):
@@ -78,5 +101,10 @@ class TestSTM(unittest.TestCase):
         self.assertEqual(result.socialWelfare, 13)
         self.assertAlmostEqual(result.efficiencyRatio, 0.7647058823529411)
 
+        # Gamma is given as node labels, the seller included
+        Gamma = STM.getTopoGamma(G, seller)
+        self.assertEqual(Gamma, [0, 1, 2, 3, 4, 5])
+        self.assertEqual(stm(G, seller, Gamma).monetaryTransfer, result.monetaryTransfer)
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
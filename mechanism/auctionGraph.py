@@ -0,0 +1,129 @@
+import networkx as nx
+import numpy as np
+from typing import Any, Sequence
+import unittest
+
+try:
+    from dominator import toCSR, transposeCSR
+except ImportError:
+    from mechanism.dominator import toCSR, transposeCSR
+
+class AuctionGraph:
+    # A compact directed graph for diffusion auctions: int32 CSR out- and
+    # in-adjacency over node indices 0..n-1 plus a float64 bid per node.
+    # nodes[k] is the label of node k and index maps labels back to indices;
+    # for unlabelled graphs both are range(n), which maps k to itself.
+    __slots__ = ('nodes', 'index', 'indptr', 'indices', 'rindptr', 'rindices', 'bid')
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, bid: np.ndarray = None,
+            nodes: Sequence[Any] = None, index: Any = None,
+            rindptr: np.ndarray = None, rindices: np.ndarray = None):
+        n = len(indptr) - 1
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        if rindptr is None:
+            rindptr, rindices = transposeCSR(self.indptr, self.indices)
+        self.rindptr = np.asarray(rindptr, dtype=np.int64)
+        self.rindices = np.asarray(rindices, dtype=np.int32)
+        self.bid = np.zeros(n) if bid is None else np.asarray(bid, dtype=np.float64)
+        if nodes is None:
+            nodes = index = range(n)
+        elif index is None:
+            index = {x: k for k, x in enumerate(nodes)}
+        self.nodes, self.index = nodes, index
+
+    @classmethod
+    def fromEdges(cls, n: int, src: np.ndarray, dst: np.ndarray, bid: np.ndarray = None,
+            nodes: Sequence[Any] = None) -> 'AuctionGraph':
+        # build from parallel edge arrays over indices 0..n-1; duplicate edges
+        # are dropped and the successors of a node keep their first-seen order
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        _, first = np.unique(src * n + dst, return_index=True)
+        first.sort()
+        src, dst = src[first], dst[first]
+        order = np.argsort(src, kind='stable')
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum(np.bincount(src, minlength=n))
+        return cls(indptr, dst[order], bid, nodes)
+
+    @classmethod
+    def fromNetworkx(cls, G: nx.DiGraph, bid: str = "bid") -> 'AuctionGraph':
+        # node and edge order follow G; missing bids become 0
+        nodes, index, indptr, indices = toCSR(G)
+        b = None
+        if bid is not None:
+            b = np.fromiter((0 if x is None else x for _, x in G.nodes.data(bid)),
+                dtype=np.float64, count=len(nodes))
+        if nodes == list(range(len(nodes))):
+            nodes = index = None
+        return cls(indptr, indices, b, nodes, index)
+
+    def toNetworkx(self, bid: str = "bid") -> nx.DiGraph:
+        # bid names the node attribute the bids are written to (None for none)
+        G = nx.DiGraph()
+        G.add_nodes_from(self.nodes)
+        nodes = self.nodes
+        src, dst = self.edges()
+        G.add_edges_from((nodes[i], nodes[j]) for i, j in zip(src.tolist(), dst.tolist()))
+        if bid is not None:
+            nx.set_node_attributes(G, dict(zip(nodes, self.bid.tolist())), bid)
+        return G
+
+    def withBids(self, bid: np.ndarray) -> 'AuctionGraph':
+        # the same (shared, not copied) adjacency with another bid vector
+        return AuctionGraph(self.indptr, self.indices, bid, self.nodes, self.index,
+            self.rindptr, self.rindices)
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def number_of_nodes(self) -> int:
+        return len(self)
+
+    def number_of_edges(self) -> int:
+        return len(self.indices)
+
+    def outDegree(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    def inDegree(self) -> np.ndarray:
+        return np.diff(self.rindptr)
+
+    def successors(self, k: int) -> np.ndarray:
+        return self.indices[self.indptr[k]:self.indptr[k + 1]]
+
+    def predecessors(self, k: int) -> np.ndarray:
+        return self.rindices[self.rindptr[k]:self.rindptr[k + 1]]
+
+    def edges(self):
+        # (source, target) index arrays in CSR order
+        return np.repeat(np.arange(len(self), dtype=np.int32), self.outDegree()), self.indices
+
+class TestAuctionGraph(unittest.TestCase):
+    def test_networkx(self):
+        G = nx.DiGraph()
+        E = [('s', 'A'), ('s', 'B'), ('A', 'C'), ('B', 'C'), ('C', 's')]
+        G.add_edges_from(E)
+        nx.set_node_attributes(G, {'s': 0, 'A': 1, 'B': 2, 'C': 3}, "bid")
+        graph = AuctionGraph.fromNetworkx(G)
+        self.assertEqual(list(graph.nodes), ['s', 'A', 'B', 'C'])
+        self.assertEqual(graph.bid.tolist(), [0, 1, 2, 3])
+        self.assertEqual(graph.successors(graph.index['s']).tolist(), [1, 2])
+        self.assertEqual(graph.predecessors(graph.index['C']).tolist(), [1, 2])
+        self.assertEqual(graph.inDegree().tolist(), [1, 1, 1, 2])
+        H = graph.toNetworkx()
+        self.assertEqual(list(H.edges), list(G.edges))
+        self.assertEqual(dict(H.nodes.data("bid")), dict(G.nodes.data("bid")))
+
+    def test_edges(self):
+        graph = AuctionGraph.fromEdges(4, [2, 0, 0, 2, 0], [3, 2, 1, 3, 2])
+        self.assertIsInstance(graph.nodes, range)
+        self.assertEqual(graph.number_of_edges(), 3)
+        self.assertEqual(graph.indptr.tolist(), [0, 2, 2, 3, 3])
+        self.assertEqual(graph.indices.tolist(), [2, 1, 3])
+        src, dst = graph.edges()
+        self.assertEqual(list(zip(src.tolist(), dst.tolist())), [(0, 2), (0, 1), (2, 3)])
+
+if __name__ == "__main__":
+    unittest.main()
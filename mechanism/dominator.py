@@ -0,0 +1,122 @@
+import networkx as nx
+import numpy as np
+from typing import Any, List, Tuple
+import unittest
+
+def toCSR(G: nx.DiGraph) -> Tuple[List[Any], dict, np.ndarray, np.ndarray]:
+    # integer-index the nodes of G in graph order and return the out-adjacency
+    # as CSR arrays: the successors of node k are indices[indptr[k]:indptr[k + 1]]
+    nodes = list(G.nodes)
+    index = {x: k for k, x in enumerate(nodes)}
+    succ = G.succ
+    indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(succ[x]) for x in nodes])
+    indices = np.fromiter((index[y] for x in nodes for y in succ[x]),
+        dtype=np.int32, count=int(indptr[-1]))
+    return nodes, index, indptr, indices
+
+def transposeCSR(indptr: np.ndarray, indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # CSR of the reversed graph, i.e. the predecessors of every node
+    n = len(indptr) - 1
+    source = np.repeat(np.arange(n, dtype=np.int32), np.diff(indptr))
+    order = np.argsort(indices, kind='stable')
+    rindptr = np.zeros(n + 1, dtype=np.int64)
+    rindptr[1:] = np.cumsum(np.bincount(indices, minlength=n))
+    return rindptr, source[order]
+
+def immediateDominators(indptr: np.ndarray, indices: np.ndarray, start: int,
+        rindptr: np.ndarray = None, rindices: np.ndarray = None) -> np.ndarray:
+    # Semi-NCA algorithm (Georgiadis, Tarjan and Werneck 2006): semidominators
+    # as in Lengauer-Tarjan with path compression, then each idom is the
+    # nearest common ancestor of the DFS parent and the semidominator.
+    # Returns idom indexed by node; idom[start] = start, -1 if unreachable.
+    n = len(indptr) - 1
+    if rindptr is None:
+        rindptr, rindices = transposeCSR(indptr, indices)
+    ptr, adj = indptr.tolist(), indices.tolist()
+    rptr, radj = rindptr.tolist(), rindices.tolist()
+
+    # iterative DFS: pre[v] is the preorder number of node v, vertex its inverse
+    pre = [-1] * n
+    vertex, parent = [start], [0]
+    pre[start] = 0
+    stack = [(start, ptr[start])]
+    while stack:
+        v, e = stack[-1]
+        end = ptr[v + 1]
+        while e < end and pre[adj[e]] != -1:
+            e += 1
+        if e == end:
+            stack.pop()
+            continue
+        stack[-1] = (v, e + 1)
+        w = adj[e]
+        pre[w] = len(vertex)
+        parent.append(pre[v])
+        vertex.append(w)
+        stack.append((w, ptr[w]))
+
+    # semidominators, in preorder numbers, processed in reverse preorder
+    N = len(vertex)
+    semi = list(range(N))
+    label = list(range(N))
+    ancestor = [-1] * N
+    for w in range(N - 1, 0, -1):
+        x = vertex[w]
+        s = semi[w]
+        for k in range(rptr[x], rptr[x + 1]):
+            u = pre[radj[k]]
+            if u == -1:
+                continue
+            if ancestor[u] != -1:
+                # eval(u) with iterative path compression
+                path = []
+                y = u
+                while ancestor[ancestor[y]] != -1:
+                    path.append(y)
+                    y = ancestor[y]
+                for y in reversed(path):
+                    a = ancestor[y]
+                    if semi[label[a]] < semi[label[y]]:
+                        label[y] = label[a]
+                    ancestor[y] = ancestor[a]
+                u = label[u]
+            if semi[u] < s:
+                s = semi[u]
+        semi[w] = s
+        ancestor[w] = parent[w]
+
+    # idom is the nearest ancestor of the DFS parent not below the semidominator
+    idom = [0] * N
+    for w in range(1, N):
+        x = parent[w]
+        while x > semi[w]:
+            x = idom[x]
+        idom[w] = x
+
+    result = np.full(n, -1, dtype=np.int64)
+    result[vertex] = [vertex[x] for x in idom]
+    return result
+
+class TestDominator(unittest.TestCase):
+    def test_hand(self):
+        G = nx.DiGraph()
+        E = [(0, 1), (0, 2), (0, 3), (0, 4), (1, 5), (2, 5), (3, 6), (5, 7), (8, 9)]
+        G.add_edges_from(E)
+        nodes, index, indptr, indices = toCSR(G)
+        idom = immediateDominators(indptr, indices, index[0])
+        self.assertEqual(idom.tolist(), [0, 0, 0, 0, 0, 0, 3, 5, -1, -1])
+
+    def test_networkx(self):
+        for seed in range(30):
+            G = nx.gnp_random_graph(60, 0.02 + 0.002 * seed, seed=seed, directed=True)
+            nodes, index, indptr, indices = toCSR(G)
+            for start in [0, 7, 31]:
+                idom = immediateDominators(indptr, indices, start)
+                expected = nx.immediate_dominators(G, start)
+                expected[start] = start
+                got = {nodes[k]: nodes[int(x)] for k, x in enumerate(idom) if x != -1}
+                self.assertEqual(got, expected)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,56 +1,131 @@
 import networkx as nx
 import numpy as np
+import math
 from abc import ABC, abstractmethod
-from typing import Any, List, Dict, Tuple
+from typing import Any, List, Dict, Tuple, Union
 import unittest
 
+try:
+    from topology import Topology, bfs
+    from auctionGraph import AuctionGraph
+except ImportError:
+    from mechanism.topology import Topology, bfs
+    from mechanism.auctionGraph import AuctionGraph
+
 class DiffusionAuction(ABC):
     class MechanismResult:
-        def __init__(self, seller: Any, winner: Any, monetaryTransfer: Dict[Any, float], G: nx.DiGraph):
-            self.seller = seller
-            self.winner = winner
-            self.monetaryTransfer = monetaryTransfer
-            self.G = G
-        
-        @property
-        def feasible(self) -> bool:
-            return self.winner in self.G.nodes \
-                and sum(self.monetaryTransfer.values()) == 0 \
-                and all(self.monetaryTransfer[x] == 0 for x in self.G.nodes - nx.descendants(self.G, self.seller) - set([self.seller]))
+        # Outcome of one auction. Only scalars and the non-zero part of the
+        # transfers are kept (as node index / amount arrays); node labels are
+        # resolved through the shared topology, never through the graph.
+        __slots__ = ('topology', 'seller', 'winner', 'winnerIndex', 'revenue',
+            'socialWelfare', 'Optimal', 'transferNodes', 'transferAmounts')
 
+        def __init__(self, topology: Topology, winner: int, transfer: Dict[int, float], bid: np.ndarray):
+            self.topology = topology
+            self.seller = topology.seller
+            self.winnerIndex = winner
+            self.winner = topology.nodes[winner]
+            self.transferNodes = np.fromiter(transfer.keys(), dtype=np.int64, count=len(transfer))
+            self.transferAmounts = np.fromiter(transfer.values(), dtype=np.float64, count=len(transfer))
+            self.revenue = float(transfer.get(topology.root, 0))
+            self.socialWelfare = float(bid[winner])
+            self.Optimal = float(bid[topology.order].max())
+        
         @property
-        def revenue(self) -> float:
-            return self.monetaryTransfer[self.seller]
+        def monetaryTransfer(self) -> Dict[Any, float]:
+            # nodes without an entry pay and receive nothing
+            nodes = self.topology.nodes
+            return {nodes[i]: x for i, x in zip(self.transferNodes.tolist(), self.transferAmounts.tolist())}
 
         @property
-        def socialWelfare(self) -> float:
-            return self.G.nodes[self.winner]["bid"]
-        
-        @property
-        def Optimal(self) -> float:
-            return getOptimal(self.G, self.seller)
+        def feasible(self) -> bool:
+            # transfers may carry rounding error from the price arithmetic
+            reachable = self.topology.reachable
+            return bool(reachable[self.winnerIndex]) \
+                and abs(math.fsum(self.transferAmounts)) <= 1e-9 * max(1.0, np.abs(self.transferAmounts).max(initial = 0)) \
+                and bool(np.all(reachable[self.transferNodes] | (self.transferAmounts == 0)))
         
         @property
         def efficiencyRatio(self) -> float:
             if self.seller == self.winner:
                 return 0
-            return self.socialWelfare / getOptimal(self.G, self.seller)
+            return self.socialWelfare / self.Optimal
         
         @property
         def normalizedRevenue(self) -> float:
             if self.seller == self.winner:
                 return 0
-            return self.revenue / getOptimal(self.G, self.seller)
-    
+            return self.revenue / self.Optimal
+
+    class BatchResult:
+        # outcomes of one mechanism on K bid profiles over the same topology;
+        # sellerIndex and winner are node indices of the topology, the rest are
+        # float arrays
+        def __init__(self, sellerIndex: int, winner: np.ndarray, revenue: np.ndarray,
+                socialWelfare: np.ndarray, Optimal: np.ndarray):
+            self.sellerIndex = sellerIndex
+            self.winner = winner
+            self.revenue = revenue
+            self.socialWelfare = socialWelfare
+            self.Optimal = Optimal
+
+        def __len__(self):
+            return len(self.winner)
+
+    # the generator of a randomized mechanism (e.g. the random shortest-path
+    # tree of SCM); experiments give it a seeded generator for every trial
+    rng: np.random.Generator = None
+
     @abstractmethod
-    def __call__(self, G: nx.DiGraph, seller: Any) -> MechanismResult:
+    def allocate(self, topology: Topology, bid: np.ndarray) -> Tuple[int, Dict[int, float]]:
+        # run the mechanism on one bid array over the node indices of topology;
+        # returns the winner index and the monetary transfers by node index
         pass
 
-def getOptimal(G: nx.DiGraph, seller) -> float:
+    def allocateBatch(self, topology: Topology, bids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # winner indices and revenues for a (K x n) bid matrix, one profile at
+        # a time unless a mechanism overrides it
+        winner = np.empty(len(bids), dtype=np.int64)
+        revenue = np.empty(len(bids))
+        for k in range(len(bids)):
+            w, transfer = self.allocate(topology, bids[k])
+            winner[k] = w
+            revenue[k] = transfer.get(topology.root, 0)
+        return winner, revenue
+
+    def __call__(self, G: Union[nx.DiGraph, AuctionGraph], seller: Any, topology: Topology = None) -> MechanismResult:
+        # topology, if given, must have been computed on a graph with the same
+        # nodes and edges as G (the bids may differ)
+        if topology is None:
+            topology = Topology(G, seller)
+        bid = topology.getBids(G)
+        winner, transfer = self.allocate(topology, bid)
+        return DiffusionAuction.MechanismResult(topology, winner, transfer, bid)
+
+    def runBatch(self, G: Union[nx.DiGraph, AuctionGraph], seller: Any, bids: np.ndarray, topology: Topology = None) -> BatchResult:
+        # evaluate K bid profiles on one graph without copying it: bids is a
+        # (K x n) matrix whose columns follow the node order of G
+        if topology is None:
+            topology = Topology(G, seller)
+        bids = np.atleast_2d(np.asarray(bids, dtype=np.float64))
+        winner, revenue = self.allocateBatch(topology, bids)
+        socialWelfare = bids[np.arange(len(bids)), winner]
+        Optimal = bids[:, topology.order].max(axis=1)
+        return DiffusionAuction.BatchResult(topology.root, winner, revenue, socialWelfare, Optimal)
+
+def getOptimal(G: Union[nx.DiGraph, AuctionGraph], seller, topology: Topology = None) -> float:
+    if topology is not None:
+        return float(topology.getBids(G)[topology.order].max())
+    if not isinstance(G, nx.Graph):
+        dist = bfs(G.indptr, G.indices, G.index[seller])
+        return float(G.bid[dist >= 0].max())
     reachableNodes = nx.descendants(G, seller) | set([seller])
     return max([G.nodes[i]["bid"] for i in reachableNodes])
 
-def getAverageBid(G: nx.DiGraph, seller) -> float:
+def getAverageBid(G: Union[nx.DiGraph, AuctionGraph], seller) -> float:
+    if not isinstance(G, nx.Graph):
+        dist = bfs(G.indptr, G.indices, G.index[seller])
+        return np.mean(G.bid[dist >= 0])
     reachableNodes = nx.descendants(G, seller) | set([seller])
     return np.mean([G.nodes[i]["bid"] for i in reachableNodes])
 
@@ -65,6 +140,10 @@ class TestOptimal(unittest.TestCase):
         self.assertEqual(getOptimal(G, 5), 5)
         self.assertEqual(getOptimal(G, 8), 3)
         self.assertEqual(getOptimal(G, 9), 2)
+        graph = AuctionGraph.fromNetworkx(G)
+        self.assertEqual(getOptimal(graph, 0), 9)
+        self.assertEqual(getOptimal(graph, 5), 5)
+        self.assertEqual(getOptimal(graph, 8), 3)
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,148 @@
+import networkx as nx
+import numpy as np
+from collections import OrderedDict
+from functools import cached_property
+from typing import Any, Dict, List, Union
+import unittest
+
+try:
+    from dominator import immediateDominators
+    from auctionGraph import AuctionGraph
+except ImportError:
+    from mechanism.dominator import immediateDominators
+    from mechanism.auctionGraph import AuctionGraph
+
+def bfs(indptr: np.ndarray, indices: np.ndarray, source: int) -> np.ndarray:
+    # BFS distances from source over CSR adjacency, -1 for unreachable nodes.
+    # One pass gives both reachability (dist >= 0) and the distance order.
+    ptr, adj = indptr.tolist(), indices.tolist()
+    dist = [-1] * (len(ptr) - 1)
+    dist[source] = 0
+    frontier = [source]
+    d = 0
+    while frontier:
+        d += 1
+        nextFrontier = []
+        for v in frontier:
+            for k in range(ptr[v], ptr[v + 1]):
+                w = adj[k]
+                if dist[w] == -1:
+                    dist[w] = d
+                    nextFrontier.append(w)
+        frontier = nextFrontier
+    return np.array(dist, dtype=np.int64)
+
+class Topology:
+    # Everything a diffusion auction needs to know about (G, seller) that does
+    # not depend on the bids. It is computed once and shared by all mechanisms
+    # and bid profiles that run on the same graph and seller.
+    # Nodes are integer-indexed in graph order (nodes[k] is the label of node k)
+    # and every per-node quantity is a NumPy array over these indices.
+    def __init__(self, G: Union[nx.DiGraph, AuctionGraph], seller: Any):
+        if isinstance(G, nx.Graph):
+            G = AuctionGraph.fromNetworkx(G, bid = None)
+        self.setup(seller, G.nodes, G.index, G.indptr, G.indices, G.rindptr, G.rindices)
+
+    @classmethod
+    def fromCSR(cls, seller: Any, nodes: List[Any], index: Dict[Any, int],
+            indptr: np.ndarray, indices: np.ndarray,
+            rindptr: np.ndarray = None, rindices: np.ndarray = None) -> 'Topology':
+        # topology of a graph given directly as CSR arrays, e.g. a filtered
+        # view of another topology's adjacency sharing its nodes and index
+        topology = cls.__new__(cls)
+        topology.setup(seller, nodes, index, indptr, indices, rindptr, rindices)
+        return topology
+
+    def setup(self, seller, nodes, index, indptr, indices, rindptr=None, rindices=None):
+        self.seller = seller
+        self.nodes, self.index, self.indptr, self.indices = nodes, index, indptr, indices
+        self.root = self.index[seller]
+        n = len(self.nodes)
+
+        # BFS distances (-1 if unreachable) and the reachable nodes sorted by
+        # distance, ties kept in graph order; levelPtr delimits each distance
+        self.dist = bfs(self.indptr, self.indices, self.root)
+        order = np.flatnonzero(self.dist >= 0)
+        self.order = order[np.argsort(self.dist[order], kind='stable')]
+        self.levelPtr = np.searchsorted(self.dist[self.order], np.arange(self.dist.max() + 2))
+        self.reachable = self.dist >= 0
+
+        # dominator tree: idom[k] is the parent of k (idom[root] = root) and the
+        # children of k are children[childPtr[k]:childPtr[k + 1]], in BFS order
+        self.idom = immediateDominators(self.indptr, self.indices, self.root, rindptr, rindices)
+        nonRoot = self.order[1:]
+        self.children = nonRoot[np.argsort(self.idom[nonRoot], kind='stable')]
+        self.childPtr = np.zeros(n + 1, dtype=np.int64)
+        self.childPtr[1:] = np.cumsum(np.bincount(self.idom[nonRoot], minlength=n))
+        # Gamma: the nodes immediately dominated by the seller
+        self.Gamma = self.children[self.childPtr[self.root]:self.childPtr[self.root + 1]]
+
+    @cached_property
+    def reachableNodes(self) -> List[Any]:
+        # labels of the reachable nodes in BFS order
+        return [self.nodes[k] for k in self.order.tolist()]
+
+    def getBids(self, G: Union[nx.DiGraph, AuctionGraph]) -> np.ndarray:
+        # bids as a float array over the node indices; for a networkx graph
+        # only the reachable nodes are read and the others are 0
+        if not isinstance(G, nx.Graph):
+            return G.bid
+        bid = G.nodes.data("bid")
+        b = np.zeros(len(self.nodes))
+        b[self.order] = [bid[x] for x in self.reachableNodes]
+        return b
+
+class TopologyCache:
+    # A bounded LRU cache of Topology objects keyed by (graph, seller).
+    # Graphs are compared by identity, so the cache must be fed the same
+    # (unmodified) graph object every time.
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+
+    def __call__(self, G: Union[nx.DiGraph, AuctionGraph], seller: Any) -> Topology:
+        key = (id(G), seller)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] is G:
+            self.entries.move_to_end(key)
+            return entry[1]
+        topology = Topology(G, seller)
+        self.entries[key] = (G, topology)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last = False)
+        return topology
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+
+class TestTopology(unittest.TestCase):
+    def test_topology(self):
+        G = nx.DiGraph()
+        E = [(0, 1), (0, 2), (0, 3), (0, 4), (1, 5), (2, 5), (3, 6), (5, 7), (8, 9)]
+        G.add_edges_from(E)
+        topology = Topology(G, 0)
+        self.assertEqual(topology.reachableNodes, [0, 1, 2, 3, 4, 5, 6, 7])
+        self.assertEqual(topology.dist.tolist(), [0, 1, 1, 1, 1, 2, 2, 3, -1, -1])
+        self.assertEqual(topology.levelPtr.tolist(), [0, 1, 5, 7, 8])
+        self.assertEqual(topology.idom.tolist(), [0, 0, 0, 0, 0, 0, 3, 5, -1, -1])
+        self.assertEqual(topology.children.tolist(), [1, 2, 3, 4, 5, 6, 7])
+        self.assertEqual(topology.childPtr.tolist(), [0, 5, 5, 5, 6, 6, 7, 7, 7, 7, 7])
+        self.assertEqual(topology.Gamma.tolist(), [1, 2, 3, 4, 5])
+
+    def test_cache(self):
+        G = nx.DiGraph([(0, 1), (1, 2)])
+        H = nx.DiGraph([(0, 1), (1, 2)])
+        cache = TopologyCache(maxsize = 2)
+        t = cache(G, 0)
+        self.assertIs(cache(G, 0), t)
+        self.assertIsNot(cache(H, 0), t)
+        cache(G, 1)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNot(cache(G, 0), t)
+
+if __name__ == "__main__":
+    unittest.main()
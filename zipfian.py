@@ -1,25 +1,49 @@
 # https://stackoverflow.com/a/8788662
+# vectorized with NumPy: the CDF is a cumulative sum and samples are drawn
+# in whole arrays by inverse-CDF lookup with searchsorted
 
-import random 
-import bisect 
-import math 
-from functools import reduce
+import numpy as np
+import unittest
 
 class ZipfGenerator: 
-    def __init__(self, n, alpha): 
+    def __init__(self, n, alpha, seed=None): 
+        self.n, self.alpha = n, alpha
         # Calculate Zeta values from 1 to n: 
-        tmp = [1. / (math.pow(float(i), alpha)) for i in range(1, n+1)] 
-        zeta = reduce(lambda sums, x: sums + [sums[-1] + x], tmp, [0]) 
+        tmp = 1. / np.power(np.arange(1, n + 1, dtype=np.float64), alpha)
+        zeta = np.concatenate(([0.], np.cumsum(tmp)))
 
         # Store the translation map: 
-        self.distMap = [x / zeta[-1] for x in zeta] 
+        self.distMap = zeta / zeta[-1]
+        # seed may be None, an int, a SeedSequence or a np.random.Generator
+        self.rng = np.random.default_rng(seed)
 
     def next(self): 
-        # Take a uniform 0-1 pseudo-random value: 
-        u = random.random()  
+        return int(self.rvs(1)[0])
 
-        # Translate the Zipf variable: 
-        return bisect.bisect(self.distMap, u) - 1
+    def rvs(self, size, random_state=None):
+        # size is an int or a shape such as (trials, n); random_state, like
+        # in scipy.stats, overrides the generator for this call
+        rng = self.rng if random_state is None else np.random.default_rng(random_state)
+        # Take uniform 0-1 pseudo-random values: 
+        u = rng.random(size)
 
-    def rvs(self, len):
-        return [self.next() for i in range(len)]
+        # Translate them to Zipf variables: 
+        return np.searchsorted(self.distMap, u, side='right') - 1
+
+class TestZipf(unittest.TestCase):
+    def test_rvs(self):
+        zipf = ZipfGenerator(n = 50, alpha = 1, seed = 3)
+        # P(k) is proportional to (k + 1)^-alpha over 0..n-1
+        pmf = np.diff(zipf.distMap)
+        self.assertAlmostEqual(pmf.sum(), 1)
+        self.assertAlmostEqual(pmf[0] / pmf[9], 10)
+        # seeded draws repeat, with the generator or random_state
+        self.assertTrue(np.array_equal(ZipfGenerator(50, 1, seed = 3).rvs((4, 5)), zipf.rvs((4, 5))))
+        self.assertTrue(np.array_equal(zipf.rvs(10, random_state = 7), zipf.rvs(10, random_state = 7)))
+        draws = zipf.rvs(200000)
+        self.assertTrue(draws.min() >= 0 and draws.max() < 50)
+        frequency = np.bincount(draws, minlength = 50) / len(draws)
+        self.assertLess(np.abs(frequency - pmf).max(), 4 * np.sqrt(pmf[0] / len(draws)))
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file